@@ -0,0 +1,199 @@
+"""Accessibility-tree context from AT-SPI for Linux desktops."""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, List, Optional, Tuple
+import time
+from .display import CoordinateMapping, own_process_ids
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+ACCESSIBILITY_MODES = ("off", "augment", "reduced")
+
+# Roles worth telling Claude about; containers and decoration are skipped
+INTERACTIVE_ROLES = {
+    "push button", "toggle button", "check box", "radio button", "menu item",
+    "check menu item", "radio menu item", "menu", "link", "page tab", "combo box",
+    "entry", "password text", "text", "spin button", "slider", "list item",
+    "table cell", "tree item", "icon", "tool bar item",
+}
+
+# Elements larger than this (in screen pixels) are not used as snap targets,
+# since their center says little about where a click should land
+MAX_SNAP_AREA = 300 * 120
+
+
+@dataclass(frozen=True)
+class UIElement:
+    """An interactable element and its bounds in screen coordinates."""
+    role: str
+    name: str
+    left: int
+    top: int
+    width: int
+    height: int
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        return self.left + self.width // 2, self.top + self.height // 2
+
+    def contains(self, x: int, y: int) -> bool:
+        return self.left <= x < self.left + self.width and self.top <= y < self.top + self.height
+
+
+class ElementIndex:
+    """Interactable elements of the focused application."""
+
+    def __init__(self, elements: List[UIElement]):
+        self.elements = elements
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def element_at(self, x: int, y: int) -> Optional[UIElement]:
+        """Return the smallest snappable element containing a screen point."""
+        candidates = [
+            e for e in self.elements
+            if e.contains(x, y) and e.width * e.height <= MAX_SNAP_AREA
+        ]
+        return min(candidates, key=lambda e: e.width * e.height) if candidates else None
+
+    def snap(self, x: int, y: int) -> Tuple[int, int]:
+        """Move a screen point to the center of the element under it, if any."""
+        element = self.element_at(x, y)
+        if element is None:
+            return x, y
+        logger.debug("Snapping (%s, %s) to center of %s '%s' at %s", x, y, element.role, element.name, element.center)
+        return element.center
+
+    def to_text(self, display_size: Tuple[int, int], mapping: Optional[CoordinateMapping] = None,
+                max_elements: int = 150) -> str:
+        """Serialize the elements visible in a frame as compact text.
+
+        Bounds are converted to the frame's image coordinates so they match
+        the screenshot Claude sees. One element per line:
+        ``role "name" x,y,w,h``.
+        """
+        mapping = mapping or CoordinateMapping()
+        width, height = display_size
+        lines = []
+        for element in self.elements:
+            x1, y1 = mapping.from_screen(element.left, element.top)
+            x2, y2 = mapping.from_screen(element.left + element.width, element.top + element.height)
+            if x2 <= 0 or y2 <= 0 or x1 >= width or y1 >= height:
+                continue
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            name = element.name.replace('"', "'")[:60]
+            lines.append(f'{element.role} "{name}" {x1},{y1},{x2 - x1},{y2 - y1}')
+            if len(lines) >= max_elements:
+                break
+        if not lines:
+            return ""
+        return "Interactable elements (role \"name\" x,y,width,height in screenshot coordinates):\n" + "\n".join(lines)
+
+
+def _is_own_application(app: Any) -> bool:
+    """Check whether an application is this process or the terminal running it."""
+    try:
+        return app.get_process_id() in own_process_ids()
+    except Exception:
+        return False
+
+
+def _focused_application(pyatspi, deadline: float) -> Optional[Any]:
+    """Find the application owning the active top-level window.
+
+    Returns None when that is the terminal Self Flow runs in, which holds
+    focus right after an instruction is typed, or when the search runs past
+    ``deadline`` (a ``time.perf_counter`` value).
+    """
+    desktop = pyatspi.Registry.getDesktop(0)
+    for app in desktop:
+        if app is None:
+            continue
+        for window in app:
+            if time.perf_counter() > deadline:
+                logger.info("Focused application lookup hit the accessibility time budget")
+                return None
+            if window is not None and window.getState().contains(pyatspi.STATE_ACTIVE):
+                if _is_own_application(app):
+                    logger.info("The focused application is the terminal running Self Flow; skipping it")
+                    return None
+                return app
+    return None
+
+
+def collect_elements(time_budget: float = 0.2, max_nodes: int = 5000) -> Optional[ElementIndex]:
+    """Walk the focused application's accessibility tree within a time budget.
+
+    Returns None when AT-SPI is unavailable or no application has focus.
+    The walk is breadth-first, so a budget overrun drops the deepest nodes.
+    """
+    try:
+        import pyatspi
+    except ImportError:
+        logger.warning("pyatspi not available; accessibility context disabled")
+        return None
+
+    started = time.perf_counter()
+    try:
+        app = _focused_application(pyatspi, started + time_budget)
+    except Exception as e:
+        logger.warning("Failed to query the accessibility registry: %s", e)
+        return None
+    if app is None:
+        logger.info("No focused application found in the accessibility tree")
+        return None
+
+    elements: List[UIElement] = []
+    queue: Deque[Any] = deque([app])
+    visited = 0
+    while queue and visited < max_nodes:
+        if time.perf_counter() - started > time_budget:
+            logger.info("Accessibility walk hit its %.2fs budget after %s nodes", time_budget, visited)
+            break
+        node = queue.popleft()
+        visited += 1
+        try:
+            state = node.getState()
+            if node is not app and not state.contains(pyatspi.STATE_SHOWING):
+                continue
+            role = node.getRoleName()
+            if role in INTERACTIVE_ROLES:
+                extents = node.queryComponent().getExtents(pyatspi.DESKTOP_COORDS)
+                if extents.width > 0 and extents.height > 0:
+                    elements.append(UIElement(role, node.name or "", extents.x, extents.y,
+                                              extents.width, extents.height))
+            queue.extend(child for child in node if child is not None)
+        except Exception as e:
+            logger.debug("Skipping accessible node: %s", e)
+
+    logger.info("Collected %s interactable element(s) from %s node(s) in %.3fs",
+                len(elements), visited, time.perf_counter() - started)
+    return ElementIndex(elements)
+
+
+class AccessibilityProvider:
+    """Caches the focused application's element index for a short time."""
+
+    def __init__(self, time_budget: float = 0.2, cache_ttl: float = 2.0):
+        self.time_budget = time_budget
+        self.cache_ttl = cache_ttl
+        self._index: Optional[ElementIndex] = None
+        self._fetched_at = 0.0
+
+    def get_index(self) -> Optional[ElementIndex]:
+        """Return the element index, walking the tree again once the cache expires."""
+        now = time.monotonic()
+        if self._index is not None and now - self._fetched_at < self.cache_ttl:
+            logger.debug("Using cached accessibility index (%s elements)", len(self._index))
+            return self._index
+        self._index = collect_elements(self.time_budget)
+        self._fetched_at = now
+        return self._index
+
+    def invalidate(self) -> None:
+        """Drop the cached index, e.g. after actions changed the screen."""
+        self._index = None
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import base64
 import anthropic
 from .logger import setup_logger
@@ -20,6 +20,19 @@ def build_client(api_key: str) -> anthropic.Anthropic:
         raise
 
 
+def build_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Build and return an asynchronous Anthropic client instance."""
+    logger.info("Building async Anthropic client")
+    
+    try:
+        client = anthropic.AsyncAnthropic(api_key=api_key)
+        logger.info("Async Anthropic client built successfully")
+        return client
+    except Exception as e:
+        logger.error("Failed to build async Anthropic client: %s", e)
+        raise
+
+
 def encode_image_to_base64(path: str) -> str:
     """Encode an image file to base64 string."""
     logger.info("Encoding image to base64: %s", path)
@@ -39,6 +52,89 @@ def encode_image_to_base64(path: str) -> str:
         raise
 
 
+def build_computer_use_params(
+    model: str,
+    instruction_text: str,
+    image_b64: str,
+    media_type: str,
+    display_size: Tuple[int, int],
+    system_prompt: str,
+    max_tokens: int = 1024,
+    extra_tools: Optional[List[Dict[str, Any]]] = None,
+    context_text: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build the keyword arguments of a computer-use ``messages.create`` call.
+    
+    ``extra_tools`` are client-side tools offered next to the computer tool.
+    ``context_text`` is sent as an extra text block before the screenshot.
+    """
+    width, height = display_size
+    content: List[Dict[str, Any]] = [{"type": "text", "text": instruction_text}]
+    if context_text:
+        content.append({"type": "text", "text": context_text})
+    content.append({
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": media_type,
+            "data": image_b64,
+        },
+    })
+    return {
+        "model": model,
+        "system": system_prompt,
+        "messages": [
+            {
+                "role": "user",
+                "content": content,
+            }
+        ],
+        "tools": [{
+            "type": "computer_20250124",
+            "name": "computer",
+            "display_width_px": width,
+            "display_height_px": height,
+            "display_number": 0,
+        }] + list(extra_tools or []),
+        "betas": ["computer-use-2025-01-24"],
+        "max_tokens": max_tokens,
+    }
+
+
+def count_request_tokens(client: anthropic.Anthropic, params: Dict[str, Any]) -> Optional[int]:
+    """Count the input tokens of a request before sending it.
+    
+    Returns None when the count is unavailable so callers can fall back
+    to local estimates.
+    """
+    logger.info("Counting input tokens for model %s", params.get("model"))
+    count_params = {k: v for k, v in params.items() if k != "max_tokens"}
+    
+    try:
+        result = client.beta.messages.count_tokens(**count_params)
+        input_tokens = int(getattr(result, "input_tokens", 0))
+        logger.info("Preflight token count: %s input tokens", input_tokens)
+        return input_tokens
+    except Exception as e:
+        logger.warning("Preflight token count failed, using estimate instead: %s", e)
+        return None
+
+
+async def count_request_tokens_async(client: anthropic.AsyncAnthropic, params: Dict[str, Any]) -> Optional[int]:
+    """Asynchronous ``count_request_tokens`` on an ``AsyncAnthropic`` client."""
+    logger.info("Counting input tokens for model %s", params.get("model"))
+    count_params = {k: v for k, v in params.items() if k != "max_tokens"}
+
+    try:
+        result = await client.beta.messages.count_tokens(**count_params)
+        input_tokens = int(getattr(result, "input_tokens", 0))
+        logger.info("Preflight token count: %s input tokens", input_tokens)
+        return input_tokens
+    except Exception as e:
+        logger.warning("Preflight token count failed, using estimate instead: %s", e)
+        return None
+
+
 def create_computer_use_request(
     client: anthropic.Anthropic,
     model: str,
@@ -48,6 +144,8 @@ def create_computer_use_request(
     display_size: Tuple[int, int],
     system_prompt: str,
     max_tokens: int = 1024,
+    extra_tools: Optional[List[Dict[str, Any]]] = None,
+    context_text: Optional[str] = None,
 ) -> Any:
     """Create a computer-use request to Claude with enhanced configuration.
     
@@ -60,71 +158,97 @@ def create_computer_use_request(
         display_size: Tuple of (width, height) for display dimensions
         system_prompt: System prompt for Claude
         max_tokens: Maximum tokens for response
+        extra_tools: Additional client-side tool definitions
+        context_text: Additional text context, such as accessibility elements
         
     Returns:
         Claude's response message
     """
+    try:
+        params = _prepare_request(model, instruction_text, image_b64, media_type, display_size,
+                                  system_prompt, max_tokens, extra_tools, context_text)
+        response = client.beta.messages.create(**params)
+        _log_response(response)
+        return response
+    except Exception as e:
+        logger.error("Failed to create computer-use request: %s", e)
+        raise
+
+
+async def create_computer_use_request_async(
+    client: anthropic.AsyncAnthropic,
+    model: str,
+    instruction_text: str,
+    image_b64: str,
+    media_type: str,
+    display_size: Tuple[int, int],
+    system_prompt: str,
+    max_tokens: int = 1024,
+    extra_tools: Optional[List[Dict[str, Any]]] = None,
+    context_text: Optional[str] = None,
+) -> Any:
+    """Asynchronous ``create_computer_use_request`` on an ``AsyncAnthropic`` client."""
+    try:
+        params = _prepare_request(model, instruction_text, image_b64, media_type, display_size,
+                                  system_prompt, max_tokens, extra_tools, context_text)
+        response = await client.beta.messages.create(**params)
+        _log_response(response)
+        return response
+    except Exception as e:
+        logger.error("Failed to create computer-use request: %s", e)
+        raise
+
+
+def _prepare_request(model: str, instruction_text: str, image_b64: str, media_type: str,
+                     display_size: Tuple[int, int], system_prompt: str, max_tokens: int,
+                     extra_tools: Optional[List[Dict[str, Any]]], context_text: Optional[str]) -> Dict[str, Any]:
+    """Log the request and build its parameters."""
     width, height = display_size
     
     logger.info("Creating computer-use request to Claude")
     logger.info("Model: %s", model)
     logger.info("Instruction length: %s characters", len(instruction_text))
     logger.info("Image base64 length: %s characters", len(image_b64))
+    if context_text:
+        logger.info("Context text length: %s characters", len(context_text))
     logger.info("Display size: %sx%s", width, height)
     logger.info("Max tokens: %s", max_tokens)
     logger.debug("System prompt length: %s characters", len(system_prompt))
     
-    try:
-        response = client.beta.messages.create(
-            model=model,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": instruction_text},
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_b64,
-                            },
-                        },
-                    ],
-                }
-            ],
-            tools=[{
-                "type": "computer_20250124",
-                "name": "computer",
-                "display_width_px": width,
-                "display_height_px": height,
-                "display_number": 0,
-            }],
-            betas=["computer-use-2025-01-24"],
-            max_tokens=max_tokens,
-        )
-        
-        logger.info("Computer-use request sent successfully")
-        logger.debug("Response received from Claude")
-        
-        # Log response details
-        if hasattr(response, 'content'):
-            content_blocks = getattr(response, 'content', []) or []
-            tool_use_blocks = [b for b in content_blocks 
-                              if getattr(b, 'type', None) == 'tool_use' 
-                              and getattr(b, 'name', None) == 'computer']
-            logger.info("Response contains %s computer action blocks", len(tool_use_blocks))
-            
-            for i, block in enumerate(tool_use_blocks):
-                tool_input = getattr(block, 'input', {}) or {}
-                action = tool_input.get('action', 'unknown')
-                logger.debug("Action %s: %s with params: %s", i+1, action, tool_input)
-        
-        return response
+    return build_computer_use_params(
+        model=model,
+        instruction_text=instruction_text,
+        image_b64=image_b64,
+        media_type=media_type,
+        display_size=display_size,
+        system_prompt=system_prompt,
+        max_tokens=max_tokens,
+        extra_tools=extra_tools,
+        context_text=context_text,
+    )
+
+
+def _log_response(response: Any) -> None:
+    """Log the usage and computer actions of a response."""
+    logger.info("Computer-use request sent successfully")
+    logger.debug("Response received from Claude")
+    
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        logger.info("Token usage: %s input, %s output", 
+                   getattr(usage, "input_tokens", None), getattr(usage, "output_tokens", None))
+    
+    # Log response details
+    if hasattr(response, 'content'):
+        content_blocks = getattr(response, 'content', []) or []
+        tool_use_blocks = [b for b in content_blocks 
+                          if getattr(b, 'type', None) == 'tool_use' 
+                          and getattr(b, 'name', None) == 'computer']
+        logger.info("Response contains %s computer action blocks", len(tool_use_blocks))
         
-    except Exception as e:
-        logger.error("Failed to create computer-use request: %s", e)
-        raise
+        for i, block in enumerate(tool_use_blocks):
+            tool_input = getattr(block, 'input', {}) or {}
+            action = tool_input.get('action', 'unknown')
+            logger.debug("Action %s: %s with params: %s", i+1, action, tool_input)
 
 
@@ -0,0 +1,350 @@
+"""Bulk offline planning through the Message Batches API.
+
+Packs many (instruction, screenshot) pairs into batch submissions, polls until
+they finish and stores the resulting action lists as JSONL for later execution.
+
+Manifest lines look like::
+
+    {"id": "login-1", "instruction": "click the login button", "screenshot": "shots/login.png"}
+
+Ids become batch ``custom_id`` values, so they must be 1-64 letters, digits,
+underscores or hyphens; the line number is used when an id is missing.
+
+An optional ``display_size`` of ``[width, height]`` declares the screen size
+the screenshot was taken at; by default the image size is used.
+
+Run with ``python -m app.batch plan MANIFEST OUTPUT`` and replay a stored plan
+with ``python -m app.batch run OUTPUT ID``.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import os
+import re
+import time
+import anthropic
+from .anthropic_client import build_client, build_computer_use_params, encode_image_to_base64
+from .config import Settings, load_settings
+from .display import get_image_size
+from .executor import execute_actions, extract_computer_actions, load_pyautogui
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Stay well inside the API's per-batch limits
+MAX_BATCH_REQUESTS = 10000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+# Serialized size of a request beyond its image and text, e.g. the tool definition
+REQUEST_OVERHEAD_BYTES = 2048
+
+# The Batches API's constraint on custom_id
+CUSTOM_ID_PATTERN = re.compile(r"[a-zA-Z0-9_-]{1,64}")
+
+MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+@dataclass
+class PlanItem:
+    """One instruction and the screenshot it should be planned against."""
+    id: str
+    instruction: str
+    screenshot: str
+    display_size: Optional[Tuple[int, int]] = None
+
+
+@dataclass
+class PlanRecord:
+    """Stored planning result for one item."""
+    id: str
+    instruction: str
+    model: str
+    display_size: Tuple[int, int]
+    actions: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    """A single result returned by a transport."""
+    custom_id: str
+    message: Any = None
+    error: Optional[str] = None
+
+
+class BatchTransport(ABC):
+    """Submits request batches and retrieves their results."""
+
+    @abstractmethod
+    def submit(self, requests: List[Dict[str, Any]], betas: List[str]) -> str:
+        """Submit requests of the form ``{"custom_id", "params"}`` and return a batch id."""
+
+    @abstractmethod
+    def is_done(self, batch_id: str) -> bool:
+        """Check whether a batch has finished processing."""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Iterator[BatchResult]:
+        """Yield the results of a finished batch."""
+
+
+class AnthropicBatchTransport(BatchTransport):
+    """Uses the Message Batches API."""
+
+    def __init__(self, client: anthropic.Anthropic):
+        self.client = client
+        self.betas: List[str] = []
+
+    def submit(self, requests: List[Dict[str, Any]], betas: List[str]) -> str:
+        self.betas = betas
+        batch = self.client.beta.messages.batches.create(requests=requests, betas=betas)
+        logger.info("Submitted batch %s with %s request(s)", batch.id, len(requests))
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch = self.client.beta.messages.batches.retrieve(batch_id, betas=self.betas)
+        counts = getattr(batch, "request_counts", None)
+        logger.info("Batch %s: %s (%s)", batch_id, batch.processing_status, counts)
+        return batch.processing_status == "ended"
+
+    def results(self, batch_id: str) -> Iterator[BatchResult]:
+        for entry in self.client.beta.messages.batches.results(batch_id, betas=self.betas):
+            result = entry.result
+            if result.type == "succeeded":
+                yield BatchResult(entry.custom_id, message=result.message)
+            else:
+                error = getattr(result, "error", None)
+                yield BatchResult(entry.custom_id, error=f"{result.type}: {error}" if error else result.type)
+
+
+class LocalBatchTransport(BatchTransport):
+    """Stand-in that runs each request synchronously through ``messages.create``.
+
+    Pair it with a client whose ``base_url`` points at a local stub server to
+    exercise batch planning without the Batches API.
+    """
+
+    def __init__(self, client: anthropic.Anthropic):
+        self.client = client
+        self._batches: Dict[str, List[BatchResult]] = {}
+
+    def submit(self, requests: List[Dict[str, Any]], betas: List[str]) -> str:
+        batch_id = f"local_{len(self._batches) + 1}"
+        results = []
+        for request in requests:
+            try:
+                message = self.client.beta.messages.create(betas=betas, **request["params"])
+                results.append(BatchResult(request["custom_id"], message=message))
+            except Exception as e:
+                logger.error("Local request %s failed: %s", request["custom_id"], e)
+                results.append(BatchResult(request["custom_id"], error=str(e)))
+        self._batches[batch_id] = results
+        logger.info("Completed local batch %s with %s request(s)", batch_id, len(requests))
+        return batch_id
+
+    def is_done(self, batch_id: str) -> bool:
+        return True
+
+    def results(self, batch_id: str) -> Iterator[BatchResult]:
+        return iter(self._batches.pop(batch_id, []))
+
+
+def load_manifest(path: str) -> List[PlanItem]:
+    """Load plan items from a JSONL manifest.
+
+    Raises ``ValueError`` for an id the Batches API would reject, before
+    anything is submitted.
+    """
+    items = []
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            screenshot = data["screenshot"]
+            if not os.path.isabs(screenshot):
+                screenshot = os.path.join(base_dir, screenshot)
+            item_id = str(data.get("id", line_number))
+            if not CUSTOM_ID_PATTERN.fullmatch(item_id):
+                raise ValueError(f"{path}:{line_number}: id {item_id!r} must be 1-64 letters, digits, '_' or '-'")
+            display_size = tuple(data["display_size"]) if data.get("display_size") else None
+            items.append(PlanItem(item_id, data["instruction"], screenshot, display_size))
+    logger.info("Loaded %s item(s) from manifest %s", len(items), path)
+    return items
+
+
+def build_batch_request(item: PlanItem, model: str, settings: Settings) -> Tuple[Dict[str, Any], Tuple[int, int]]:
+    """Build one batch request and return it with the display size it declares."""
+    display_size = item.display_size or get_image_size(item.screenshot)
+    extension = os.path.splitext(item.screenshot)[1].lower()
+    params = build_computer_use_params(
+        model=model,
+        instruction_text=item.instruction,
+        image_b64=encode_image_to_base64(item.screenshot),
+        media_type=MEDIA_TYPES.get(extension, "image/png"),
+        display_size=display_size,
+        system_prompt=settings.system_prompt,
+        max_tokens=settings.max_tokens,
+    )
+    # Betas are sent once for the whole batch
+    params.pop("betas", None)
+    return {"custom_id": item.id, "params": params}, display_size
+
+
+def estimate_request_bytes(request: Dict[str, Any]) -> int:
+    """Estimate the serialized size of a batch request from its image and text lengths."""
+    params = request["params"]
+    size = REQUEST_OVERHEAD_BYTES + len(params.get("system", ""))
+    for message in params["messages"]:
+        for block in message["content"]:
+            if block["type"] == "image":
+                size += len(block["source"]["data"])
+            else:
+                size += len(block.get("text", ""))
+    return size
+
+
+def chunk_requests(requests: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    """Split requests into batches within the count and size limits.
+
+    Requests are consumed lazily, so only one chunk is held at a time.
+    """
+    chunk: List[Dict[str, Any]] = []
+    chunk_bytes = 0
+    for request in requests:
+        size = estimate_request_bytes(request)
+        if chunk and (len(chunk) >= MAX_BATCH_REQUESTS or chunk_bytes + size > MAX_BATCH_BYTES):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def build_batch_requests(items: List[PlanItem], model: str, settings: Settings,
+                         records: Dict[str, PlanRecord]) -> Iterator[Dict[str, Any]]:
+    """Build batch requests one at a time, adding a record for each item to ``records``.
+
+    Items whose screenshot cannot be read get a record with the error and
+    no request.
+    """
+    for item in items:
+        if item.id in records:
+            raise ValueError(f"Duplicate manifest id: {item.id}")
+        try:
+            request, display_size = build_batch_request(item, model, settings)
+        except Exception as e:
+            logger.error("Skipping item %s: %s", item.id, e)
+            records[item.id] = PlanRecord(item.id, item.instruction, model, (0, 0), error=str(e))
+            continue
+        records[item.id] = PlanRecord(item.id, item.instruction, model, display_size)
+        yield request
+
+
+def plan_batch(transport: BatchTransport, items: List[PlanItem], settings: Settings,
+               model: Optional[str] = None, poll_interval: float = 30.0) -> List[PlanRecord]:
+    """Plan actions for all items and return one record per item.
+
+    Each batch is submitted as soon as it is full, so the encoded
+    screenshots of only one batch are in memory at a time.
+    """
+    model = model or settings.model
+    records: Dict[str, PlanRecord] = {}
+    batch_ids = []
+    for chunk in chunk_requests(build_batch_requests(items, model, settings, records)):
+        batch_ids.append(transport.submit(chunk, ["computer-use-2025-01-24"]))
+        # Release this batch's screenshots before the next one is encoded
+        del chunk
+
+    pending = list(batch_ids)
+    while pending:
+        pending = [batch_id for batch_id in pending if not transport.is_done(batch_id)]
+        if pending:
+            logger.info("Waiting for %s batch(es)", len(pending))
+            time.sleep(poll_interval)
+
+    for batch_id in batch_ids:
+        for result in transport.results(batch_id):
+            record = records.get(result.custom_id)
+            if record is None:
+                logger.warning("Result for unknown id %s", result.custom_id)
+                continue
+            if result.error:
+                record.error = result.error
+            else:
+                record.actions = extract_computer_actions(result.message)
+
+    planned = sum(1 for r in records.values() if r.error is None)
+    logger.info("Planned %s/%s item(s)", planned, len(records))
+    return list(records.values())
+
+
+def save_plans(records: List[PlanRecord], path: str) -> None:
+    """Write plan records as JSONL."""
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(asdict(record)) + "\n")
+    logger.info("Saved %s plan(s) to %s", len(records), path)
+
+
+def load_plans(path: str) -> Dict[str, PlanRecord]:
+    """Read plan records written by ``save_plans``, keyed by id."""
+    plans = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                data["display_size"] = tuple(data["display_size"])
+                plans[data["id"]] = PlanRecord(**data)
+    return plans
+
+
+def execute_plan(record: PlanRecord, max_retries: int = 2) -> int:
+    """Execute a stored plan's actions and return the number that succeeded."""
+    if record.error:
+        logger.error("Plan %s has no actions: %s", record.id, record.error)
+        return 0
+    pyautogui = load_pyautogui()
+    if pyautogui is None:
+        return 0
+    return execute_actions(record.actions, pyautogui, record.display_size, max_retries)
+
+
+def main() -> None:
+    """Command-line entry point for batch planning and replay."""
+    parser = argparse.ArgumentParser(description="Self Flow bulk planning")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan = commands.add_parser("plan", help="Plan actions for a manifest of instructions and screenshots")
+    plan.add_argument("manifest")
+    plan.add_argument("output")
+    plan.add_argument("--model", help="Model to plan with (defaults to the configured model)")
+    plan.add_argument("--poll-interval", type=float, default=30.0)
+    plan.add_argument("--local", action="store_true",
+                      help="Send requests one by one instead of using the Batches API")
+
+    run = commands.add_parser("run", help="Execute a stored plan")
+    run.add_argument("plans")
+    run.add_argument("id")
+
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        settings = load_settings()
+        client = build_client(settings.anthropic_api_key)
+        transport = LocalBatchTransport(client) if args.local else AnthropicBatchTransport(client)
+        records = plan_batch(transport, load_manifest(args.manifest), settings, args.model, args.poll_interval)
+        save_plans(records, args.output)
+    else:
+        plans = load_plans(args.plans)
+        if args.id not in plans:
+            raise SystemExit(f"No plan with id {args.id} in {args.plans}")
+        execute_plan(plans[args.id])
+
+
+if __name__ == "__main__":
+    main()
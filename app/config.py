@@ -1,5 +1,7 @@
+import json
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from .logger import setup_logger
 
@@ -30,11 +32,287 @@ INSTRUCTIONS:
 5. NEVER use screenshot action - you already have the current screen state"""
 
 
+# Model routing defaults
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+DEFAULT_FAST_MODEL = "claude-haiku-4-5-20251001"
+DEFAULT_COMPLEX_KEYWORDS = (
+    "then", "and", "after", "before", "until", "drag", "find", "search",
+    "select", "fill", "open", "menu", "all", "every", "each",
+)
+
+# Performance profiles: executor timing, retries, capture and model choice.
+# "balanced" matches the behaviour before profiles existed.
+DEFAULT_PROFILE = "balanced"
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "fast": {
+        "click_delay": 0.05,
+        "settle_delay": 0.03,
+        "move_duration": 0.0,
+        "drag_duration": 0.2,
+        "retry_delay": 0.2,
+        "max_retries": 1,
+        "capture_scale": 0.75,
+        "capture_format": "jpeg",
+        "jpeg_quality": 80,
+        "model": DEFAULT_MODEL,
+        "fast_model": DEFAULT_FAST_MODEL,
+        "max_tokens": 1024,
+    },
+    "balanced": {
+        "click_delay": 0.2,
+        "settle_delay": 0.1,
+        "move_duration": 0.25,
+        "drag_duration": 0.5,
+        "retry_delay": 0.5,
+        "max_retries": 2,
+        "capture_scale": 1.0,
+        "capture_format": "png",
+        "jpeg_quality": 85,
+        "model": DEFAULT_MODEL,
+        "fast_model": DEFAULT_FAST_MODEL,
+        "max_tokens": 1024,
+    },
+    "safe": {
+        "click_delay": 0.4,
+        "settle_delay": 0.25,
+        "move_duration": 0.5,
+        "drag_duration": 1.0,
+        "retry_delay": 1.0,
+        "max_retries": 3,
+        "capture_scale": 1.0,
+        "capture_format": "png",
+        "jpeg_quality": 90,
+        "model": DEFAULT_MODEL,
+        "fast_model": DEFAULT_MODEL,
+        "max_tokens": 2048,
+    },
+}
+CAPTURE_FORMATS = ("png", "jpeg")
+
+# Environment variables that take precedence over the active profile
+PROFILE_ENV_OVERRIDES = {
+    "model": "SELF_FLOW_MODEL",
+    "fast_model": "SELF_FLOW_FAST_MODEL",
+    "max_tokens": "SELF_FLOW_MAX_TOKENS",
+}
+
+
 @dataclass(frozen=True)
 class Settings:
     anthropic_api_key: str
     system_prompt: str = DEFAULT_SYSTEM_PROMPT
     max_tokens: int = 1024
+    model: str = DEFAULT_MODEL
+    fast_model: str = DEFAULT_FAST_MODEL
+    routing_enabled: bool = True
+    routing_max_words: int = 6
+    routing_complex_keywords: Tuple[str, ...] = DEFAULT_COMPLEX_KEYWORDS
+    routing_min_success_rate: float = 0.6
+    routing_min_samples: int = 5
+    max_input_tokens: int = 0
+    preflight_token_count: bool = False
+    adaptive_max_tokens: bool = True
+    min_image_scale: float = 0.25
+    capture_mode: str = "full"
+    capture_monitor: int = 0
+    capture_rect: Optional[Tuple[int, int, int, int]] = None
+    two_stage: bool = False
+    overview_scale: float = 0.25
+    zoom_padding: float = 0.1
+    zoom_max_edge: int = 1568
+    accessibility_mode: str = "off"
+    accessibility_time_budget: float = 0.2
+    accessibility_cache_ttl: float = 2.0
+    accessibility_max_elements: int = 150
+    accessibility_screenshot_scale: float = 0.5
+    accessibility_snap: bool = True
+    executor_socket: str = ""
+    recorder_capacity_mb: int = 64
+    recorder_dir: str = "flight_records"
+    memory_tracing: bool = False
+    memory_snapshot_interval: int = 20
+    memory_rss_warn_mb: int = 0
+    memory_rss_limit_mb: int = 0
+    instruction_queue: bool = False
+    capture_timeout: float = 15.0
+    request_timeout: float = 120.0
+    execute_timeout: float = 60.0
+    profile: str = DEFAULT_PROFILE
+    profile_file: str = ""
+    click_delay: float = 0.2
+    settle_delay: float = 0.1
+    move_duration: float = 0.25
+    drag_duration: float = 0.5
+    retry_delay: float = 0.5
+    max_retries: int = 2
+    capture_scale: float = 1.0
+    capture_format: str = "png"
+    jpeg_quality: int = 85
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean flag from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer from the environment, falling back on invalid values."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning("Invalid integer for %s: '%s', using default %s", name, value, default)
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float from the environment, falling back on invalid values."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Invalid number for %s: '%s', using default %s", name, value, default)
+        return default
+
+
+def _env_rect(name: str) -> Optional[Tuple[int, int, int, int]]:
+    """Read a rectangle given as "left,top,width,height" from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return None
+    try:
+        left, top, width, height = (int(part) for part in value.split(","))
+        return left, top, width, height
+    except ValueError:
+        logger.warning("Invalid rectangle for %s: '%s', expected left,top,width,height", name, value)
+        return None
+
+
+def _env_list(name: str, default: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Read a comma-separated list from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return tuple(item.strip().lower() for item in value.split(",") if item.strip())
+
+
+def _coerce_profile_value(name: str, value: Any, default: Any) -> Any:
+    """Convert a profile value to the type of its built-in default."""
+    if isinstance(default, bool):
+        return bool(value)
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    value = str(value).strip()
+    if name == "capture_format":
+        value = value.lower().replace("jpg", "jpeg")
+        if value not in CAPTURE_FORMATS:
+            raise ValueError(f"expected one of {', '.join(CAPTURE_FORMATS)}")
+    return value
+
+
+def load_profile_file(path: str) -> Tuple[Optional[str], Dict[str, Dict[str, Any]]]:
+    """Read a profile file and return the profile it selects and its profiles.
+
+    The file is a JSON object of the form::
+
+        {"profile": "fast", "profiles": {"fast": {"click_delay": 0.02}, "lab": {...}}}
+
+    Profiles named like a built-in one override only the values they set;
+    new names start from ``balanced``. Raises ``OSError`` or ``ValueError``
+    when the file cannot be read or parsed.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("profile file must contain a JSON object")
+    profiles = data.get("profiles") or {}
+    if not isinstance(profiles, dict) or not all(isinstance(v, dict) for v in profiles.values()):
+        raise ValueError("'profiles' must map profile names to objects")
+    selected = data.get("profile")
+    return (str(selected).strip().lower() if selected else None), profiles
+
+
+def resolve_profile(name: str, path: str = "") -> Tuple[str, Dict[str, Any]]:
+    """Return the name and values of the active profile.
+
+    Values come from the built-in profile, then the profile file, then the
+    environment overrides in ``PROFILE_ENV_OVERRIDES``. A profile file that
+    selects a profile takes precedence over ``name``.
+    """
+    custom: Dict[str, Dict[str, Any]] = {}
+    if path:
+        selected, custom = load_profile_file(path)
+        name = selected or name
+        custom = {key.strip().lower(): value for key, value in custom.items()}
+
+    if name not in PROFILES and name not in custom:
+        logger.warning("Unknown profile '%s', using '%s'", name, DEFAULT_PROFILE)
+        name = DEFAULT_PROFILE
+
+    defaults = PROFILES[DEFAULT_PROFILE]
+    values = dict(PROFILES.get(name, defaults))
+    for key, value in custom.get(name, {}).items():
+        if key not in defaults:
+            logger.warning("Ignoring unknown setting '%s' in profile '%s'", key, name)
+            continue
+        try:
+            values[key] = _coerce_profile_value(key, value, defaults[key])
+        except (TypeError, ValueError) as e:
+            logger.warning("Invalid value %r for '%s' in profile '%s': %s", value, key, name, e)
+
+    for key, env_name in PROFILE_ENV_OVERRIDES.items():
+        if isinstance(values[key], int):
+            values[key] = _env_int(env_name, values[key])
+        else:
+            values[key] = os.getenv(env_name, "").strip() or values[key]
+    return name, values
+
+
+def apply_profile(settings: Settings, name: str, values: Dict[str, Any]) -> Settings:
+    """Return a copy of ``settings`` with a profile's values applied."""
+    return replace(settings, profile=name, **values)
+
+
+class ProfileWatcher:
+    """Reloads the profile file between instructions when it changes on disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = self._current_mtime()
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def reload(self, settings: Settings) -> Optional[Settings]:
+        """Return updated settings if the file changed, otherwise None.
+
+        A file that fails to load leaves the current settings in place.
+        """
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        try:
+            name, values = resolve_profile(settings.profile, self.path)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to reload profile file %s, keeping current settings: %s", self.path, e)
+            return None
+        updated = apply_profile(settings, name, values)
+        changed = [f.name for f in fields(Settings) if getattr(updated, f.name) != getattr(settings, f.name)]
+        logger.info("Reloaded profile '%s' from %s (changed: %s)", name, self.path, ", ".join(changed) or "nothing")
+        return updated
 
 
 def load_settings() -> Settings:
@@ -59,11 +337,67 @@ def load_settings() -> Settings:
     settings = Settings(
         anthropic_api_key=api_key,
         system_prompt=DEFAULT_SYSTEM_PROMPT,
-        max_tokens=1024
+        routing_enabled=_env_bool("SELF_FLOW_ROUTING", True),
+        routing_max_words=_env_int("SELF_FLOW_ROUTING_MAX_WORDS", 6),
+        routing_complex_keywords=_env_list("SELF_FLOW_ROUTING_KEYWORDS", DEFAULT_COMPLEX_KEYWORDS),
+        routing_min_success_rate=_env_float("SELF_FLOW_ROUTING_MIN_SUCCESS", 0.6),
+        routing_min_samples=_env_int("SELF_FLOW_ROUTING_MIN_SAMPLES", 5),
+        max_input_tokens=_env_int("SELF_FLOW_MAX_INPUT_TOKENS", 0),
+        preflight_token_count=_env_bool("SELF_FLOW_PREFLIGHT_TOKENS", False),
+        adaptive_max_tokens=_env_bool("SELF_FLOW_ADAPTIVE_MAX_TOKENS", True),
+        min_image_scale=_env_float("SELF_FLOW_MIN_IMAGE_SCALE", 0.25),
+        capture_mode=os.getenv("SELF_FLOW_CAPTURE_MODE", "full").strip().lower(),
+        capture_monitor=_env_int("SELF_FLOW_CAPTURE_MONITOR", 0),
+        capture_rect=_env_rect("SELF_FLOW_CAPTURE_RECT"),
+        two_stage=_env_bool("SELF_FLOW_TWO_STAGE", False),
+        overview_scale=_env_float("SELF_FLOW_OVERVIEW_SCALE", 0.25),
+        zoom_padding=_env_float("SELF_FLOW_ZOOM_PADDING", 0.1),
+        zoom_max_edge=_env_int("SELF_FLOW_ZOOM_MAX_EDGE", 1568),
+        accessibility_mode=os.getenv("SELF_FLOW_ACCESSIBILITY", "off").strip().lower(),
+        accessibility_time_budget=_env_float("SELF_FLOW_ACCESSIBILITY_BUDGET", 0.2),
+        accessibility_cache_ttl=_env_float("SELF_FLOW_ACCESSIBILITY_CACHE_TTL", 2.0),
+        accessibility_max_elements=_env_int("SELF_FLOW_ACCESSIBILITY_MAX_ELEMENTS", 150),
+        accessibility_screenshot_scale=_env_float("SELF_FLOW_ACCESSIBILITY_SCREENSHOT_SCALE", 0.5),
+        accessibility_snap=_env_bool("SELF_FLOW_ACCESSIBILITY_SNAP", True),
+        executor_socket=os.getenv("SELF_FLOW_EXECUTOR_SOCKET", "").strip(),
+        recorder_capacity_mb=_env_int("SELF_FLOW_RECORDER_MB", 64),
+        recorder_dir=os.getenv("SELF_FLOW_RECORDER_DIR", "flight_records"),
+        memory_tracing=_env_bool("SELF_FLOW_MEMORY_TRACING", False),
+        memory_snapshot_interval=_env_int("SELF_FLOW_MEMORY_SNAPSHOT_INTERVAL", 20),
+        memory_rss_warn_mb=_env_int("SELF_FLOW_MEMORY_RSS_WARN_MB", 0),
+        memory_rss_limit_mb=_env_int("SELF_FLOW_MEMORY_RSS_LIMIT_MB", 0),
+        instruction_queue=_env_bool("SELF_FLOW_QUEUE", False),
+        capture_timeout=_env_float("SELF_FLOW_CAPTURE_TIMEOUT", 15.0),
+        request_timeout=_env_float("SELF_FLOW_REQUEST_TIMEOUT", 120.0),
+        execute_timeout=_env_float("SELF_FLOW_EXECUTE_TIMEOUT", 60.0),
+        profile_file=os.getenv("SELF_FLOW_PROFILE_FILE", "").strip(),
     )
     
+    # Apply the performance profile
+    profile_name = os.getenv("SELF_FLOW_PROFILE", DEFAULT_PROFILE).strip().lower()
+    try:
+        profile_name, profile_values = resolve_profile(profile_name, settings.profile_file)
+    except (OSError, ValueError) as e:
+        logger.error("Failed to load profile file %s: %s", settings.profile_file, e)
+        profile_name, profile_values = resolve_profile(profile_name)
+    settings = apply_profile(settings, profile_name, profile_values)
+    
     logger.info("Settings loaded successfully")
-    logger.info("Max tokens: %s", settings.max_tokens)
+    logger.info("Performance profile: %s%s (model: %s, capture: %s at %.2fx, retries: %s)",
+                settings.profile, f" from {settings.profile_file}" if settings.profile_file else "",
+                settings.model, settings.capture_format, settings.capture_scale, settings.max_retries)
+    logger.info("Max tokens: %s (adaptive: %s)", settings.max_tokens, settings.adaptive_max_tokens)
+    logger.info("Capture mode: %s%s", settings.capture_mode,
+                f" (two-stage, overview scale {settings.overview_scale})" if settings.two_stage else "")
+    if settings.accessibility_mode != "off":
+        logger.info("Accessibility context: %s", settings.accessibility_mode)
+    if settings.executor_socket:
+        logger.info("Executor daemon socket: %s", settings.executor_socket)
+    if settings.max_input_tokens:
+        logger.info("Input token budget: %s (preflight count: %s)",
+                    settings.max_input_tokens, settings.preflight_token_count)
+    logger.info("Model: %s (fast model: %s, routing %s)", settings.model, settings.fast_model,
+                "enabled" if settings.routing_enabled else "disabled")
     logger.debug("System prompt length: %s characters", len(settings.system_prompt))
     
     return settings
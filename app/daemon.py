@@ -0,0 +1,443 @@
+"""Long-lived executor daemon that owns the input backend, served over a Unix socket.
+
+Planners send batches of computer actions and receive one result message per
+executed action followed by a summary. A planner may send a cancel message
+while its batch runs; the daemon then stops before the next action, as it
+does when the planner disconnects. Messages are framed as a 4-byte
+big-endian payload length, a 1-byte codec marker and the payload, encoded with
+msgpack when it is installed and JSON otherwise.
+
+Run with ``python -m app.daemon [--socket PATH]``.
+"""
+
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import math
+import os
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+from .display import CoordinateMapping
+from .executor import ActionTiming, execute_actions, load_pyautogui, snap_click_target, validate_coordinate
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/self-flow-executor.sock"
+
+CODEC_JSON = b"j"
+CODEC_MSGPACK = b"m"
+HEADER = struct.Struct(">IB")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+COORDINATE_KEYS = ("coordinate", "start_coordinate", "end_coordinate")
+# Actions whose target is snapped in-process by the executor
+SNAPPED_ACTIONS = ("left_click", "right_click", "double_click")
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class ProtocolError(RuntimeError):
+    """Raised when a peer sends a malformed message."""
+
+
+class DaemonUnavailable(ConnectionError):
+    """Raised when a batch could not be sent, so none of its actions ran."""
+
+
+class BatchCancelled(Exception):
+    """Raised in the daemon to stop a batch its planner cancelled or abandoned."""
+
+
+def default_codec() -> bytes:
+    """Return the most compact codec available."""
+    return CODEC_MSGPACK if msgpack is not None else CODEC_JSON
+
+
+def encode_message(obj: Dict[str, Any], codec: Optional[bytes] = None) -> bytes:
+    """Encode a message with its frame header."""
+    codec = codec or default_codec()
+    if codec == CODEC_MSGPACK:
+        payload = msgpack.packb(obj, use_bin_type=True)
+    else:
+        payload = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(payload), codec[0]) + payload
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_message(sock: socket.socket) -> Tuple[Dict[str, Any], bytes]:
+    """Read one framed message and return it with the codec it used."""
+    length, codec_byte = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message of {length} bytes exceeds limit of {MAX_MESSAGE_SIZE}")
+    payload = _recv_exact(sock, length)
+    codec = bytes([codec_byte])
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ProtocolError("Peer sent msgpack but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False), codec
+    if codec == CODEC_JSON:
+        return json.loads(payload.decode("utf-8")), codec
+    raise ProtocolError(f"Unknown codec marker: {codec!r}")
+
+
+def mapping_to_dict(mapping: Optional[CoordinateMapping]) -> Optional[Dict[str, Any]]:
+    """Serialize a mapping; the snap callable stays on the client side."""
+    if mapping is None:
+        return None
+    data = asdict(mapping)
+    data.pop("snap", None)
+    return data
+
+
+def apply_snapping(tool_inputs: List[Dict[str, Any]], display_size: Tuple[int, int],
+                   mapping: Optional[CoordinateMapping]
+                   ) -> Tuple[List[Dict[str, Any]], Tuple[int, int], Optional[CoordinateMapping]]:
+    """Snap click targets on the client, since the snap function cannot be sent.
+
+    Coordinates are converted to screen pixels relative to the mapping's
+    origin and clicks are snapped as the executor would. The batch is
+    returned with the capture-sized display and a translation-only mapping.
+    Invalid coordinates stay invalid, so the daemon rejects them as the
+    executor would; a snap target outside the capture is not used.
+    """
+    if mapping is None or mapping.snap is None:
+        return tool_inputs, display_size, mapping
+
+    width = math.ceil(display_size[0] * mapping.scale_x)
+    height = math.ceil(display_size[1] * mapping.scale_y)
+    unsnapped = CoordinateMapping(mapping.scale_x, mapping.scale_y, mapping.origin_x, mapping.origin_y)
+    converted = []
+    for tool_input in tool_inputs:
+        tool_input = dict(tool_input)
+        for key in COORDINATE_KEYS:
+            if key not in tool_input:
+                continue
+            point = validate_coordinate(tool_input[key], display_size, unsnapped)
+            if point is None:
+                tool_input[key] = [-1, -1]
+                continue
+            if key == "coordinate" and tool_input.get("action") in SNAPPED_ACTIONS:
+                snapped = snap_click_target(point, mapping)
+                if 0 <= snapped[0] - mapping.origin_x < width and 0 <= snapped[1] - mapping.origin_y < height:
+                    point = snapped
+            tool_input[key] = [point[0] - mapping.origin_x, point[1] - mapping.origin_y]
+        converted.append(tool_input)
+    return converted, (width, height), CoordinateMapping(origin_x=mapping.origin_x, origin_y=mapping.origin_y)
+
+
+def _socket_is_live(socket_path: str) -> bool:
+    """Check whether something accepts connections on a Unix socket path."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(1.0)
+    try:
+        sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class ExecutorDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Executes action batches from many planners against one display.
+
+    PyAutoGUI is loaded once when the daemon starts, and batches are run
+    one at a time so actions from different planners never interleave.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        if os.path.exists(socket_path):
+            if _socket_is_live(socket_path):
+                raise RuntimeError(f"Another executor daemon is already listening on {socket_path}")
+            logger.info("Removing stale socket %s", socket_path)
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.pyautogui = load_pyautogui()
+        if self.pyautogui is None:
+            raise RuntimeError("PyAutoGUI is required to run the executor daemon")
+        self.display_lock = threading.Lock()
+        self.batches = 0
+        super().__init__(socket_path, ExecutorRequestHandler)
+        os.chmod(socket_path, 0o600)
+        logger.info("Executor daemon listening on %s (codec: %s)", socket_path,
+                    "msgpack" if msgpack is not None else "json")
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class ExecutorRequestHandler(socketserver.BaseRequestHandler):
+    """Serves one planner connection; a connection may send several batches."""
+
+    def handle(self) -> None:
+        server: ExecutorDaemon = self.server
+        logger.info("Planner connected")
+        while True:
+            try:
+                message, codec = read_message(self.request)
+            except ConnectionError:
+                break
+            except (ProtocolError, ValueError) as e:
+                logger.error("Protocol error from planner: %s", e)
+                self._send({"type": "error", "message": str(e)}, CODEC_JSON)
+                break
+
+            if not isinstance(message, dict):
+                self._send({"type": "error", "message": "Message must be a map"}, codec)
+                continue
+
+            kind = message.get("type")
+            if kind == "ping":
+                self._send({"type": "pong", "batches": server.batches}, codec)
+            elif kind == "execute":
+                self._execute(message, codec)
+            elif kind == "cancel":
+                # Arrived after its batch had already finished
+                logger.debug("Ignoring cancel with no batch running")
+            else:
+                self._send({"type": "error", "message": f"Unknown message type: {kind}"}, codec)
+        logger.info("Planner disconnected")
+
+    def _send(self, obj: Dict[str, Any], codec: bytes) -> None:
+        self.request.sendall(encode_message(obj, codec))
+
+    def _cancel_requested(self) -> bool:
+        """Check without blocking whether the planner cancelled its batch or went away."""
+        readable, _, _ = select.select([self.request], [], [], 0)
+        if not readable:
+            return False
+        try:
+            message, _ = read_message(self.request)
+        except (ConnectionError, ProtocolError, ValueError, OSError):
+            return True
+        if isinstance(message, dict) and message.get("type") == "cancel":
+            return True
+        logger.warning("Ignoring message received during a batch: %s", message)
+        return False
+
+    def _execute(self, message: Dict[str, Any], codec: bytes) -> None:
+        server: ExecutorDaemon = self.server
+        try:
+            actions = list(message.get("actions") or [])
+            width, height = message["display_size"]
+            mapping_data = message.get("mapping")
+            mapping = CoordinateMapping(**mapping_data) if mapping_data else None
+            max_retries = int(message.get("max_retries", 2))
+            timing = ActionTiming(**message["timing"]) if message.get("timing") else ActionTiming()
+        except (KeyError, TypeError, ValueError) as e:
+            self._send({"type": "error", "message": f"Invalid execute request: {e}"}, codec)
+            return
+
+        succeeded = []
+
+        def on_result(index: int, action: str, success: bool, elapsed: float) -> None:
+            succeeded.append(success)
+            try:
+                self._send({"type": "result", "index": index, "action": action,
+                            "ok": success, "elapsed_ms": round(elapsed * 1000, 2)}, codec)
+            except OSError as e:
+                raise BatchCancelled(f"Planner went away after action {index + 1}: {e}") from e
+            if self._cancel_requested():
+                raise BatchCancelled(f"Planner cancelled the batch after action {index + 1}")
+
+        started = time.perf_counter()
+        cancelled = False
+        with server.display_lock:
+            server.batches += 1
+            try:
+                # The planner may have given up while the batch waited for the display
+                if self._cancel_requested():
+                    raise BatchCancelled("Planner cancelled the batch before it started")
+                execute_actions(actions, server.pyautogui, (int(width), int(height)),
+                                max_retries, mapping, on_result, timing)
+            except BatchCancelled as e:
+                logger.warning("%s", e)
+                cancelled = True
+        try:
+            self._send({"type": "done", "successful": sum(succeeded), "cancelled": cancelled,
+                        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}, codec)
+        except OSError as e:
+            logger.info("Planner went away before the batch summary: %s", e)
+
+
+class ExecutorClient:
+    """Sends action batches to an executor daemon.
+
+    ``timeout`` bounds each wait on the daemon, including the wait for one
+    action's result, in seconds; None waits indefinitely. When it expires
+    the daemon is told to cancel the batch.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: Optional[float] = 60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.codec = default_codec()
+        self._sock: Optional[socket.socket] = None
+        # Guards sends that may come from another thread, i.e. cancel()
+        self._send_lock = threading.Lock()
+        self._batch_callback: Optional[Callable[[int, str, bool, float], None]] = None
+        self._in_batch = False
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._sock = sock
+            logger.info("Connected to executor daemon at %s", self.socket_path)
+        return self._sock
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send_request(self, data: bytes) -> None:
+        """Send a request, reconnecting once if a kept-alive connection went stale."""
+        reused = self._sock is not None
+        try:
+            self._connect().sendall(data)
+            return
+        except OSError as e:
+            self.close()
+            if not reused:
+                raise DaemonUnavailable(f"Executor daemon not reachable at {self.socket_path}: {e}") from e
+            logger.info("Connection to executor daemon went stale, reconnecting: %s", e)
+        try:
+            self._connect().sendall(data)
+        except OSError as e:
+            self.close()
+            raise DaemonUnavailable(f"Executor daemon not reachable at {self.socket_path}: {e}") from e
+
+    def cancel(self, on_result: Optional[Callable[[int, str, bool, float], None]] = None) -> None:
+        """Ask the daemon to stop the running batch before its next action.
+
+        Safe to call from any thread, and a no-op when no batch is running.
+        With ``on_result``, only a batch started with that callback is
+        cancelled, so callers sharing a client cannot stop each other's batch.
+        """
+        with self._send_lock:
+            if not self._in_batch or self._sock is None:
+                return
+            if on_result is not None and on_result is not self._batch_callback:
+                return
+            try:
+                self._sock.sendall(encode_message({"type": "cancel"}, self.codec))
+                logger.info("Asked executor daemon to cancel the running batch")
+            except OSError as e:
+                logger.warning("Could not cancel the executor daemon batch: %s", e)
+
+    def ping(self) -> bool:
+        """Check that the daemon is reachable."""
+        try:
+            sock = self._connect()
+            sock.sendall(encode_message({"type": "ping"}, self.codec))
+            reply, _ = read_message(sock)
+            return reply.get("type") == "pong"
+        except (OSError, ConnectionError, ProtocolError) as e:
+            logger.warning("Executor daemon not reachable at %s: %s", self.socket_path, e)
+            self.close()
+            return False
+
+    def execute(self, tool_inputs: List[Dict[str, Any]], display_size: Tuple[int, int],
+                mapping: Optional[CoordinateMapping] = None, max_retries: int = 2,
+                on_result: Optional[Callable[[int, str, bool, float], None]] = None,
+                timing: Optional[ActionTiming] = None) -> int:
+        """Execute a batch on the daemon and return the number of successful actions.
+
+        Per-action results are streamed to ``on_result`` as they arrive.
+        ``timing`` applies to this batch only; the daemon's defaults are used
+        without it. Click snapping is applied here, before sending, since the
+        snap function cannot be sent over the socket.
+
+        Raises ``DaemonUnavailable`` when the batch could not be sent, in
+        which case nothing was executed. If reading the results fails, or
+        ``on_result`` raises, the daemon is told to stop the batch.
+        """
+        tool_inputs, display_size, mapping = apply_snapping(tool_inputs, display_size, mapping)
+        request = {
+            "type": "execute",
+            "actions": tool_inputs,
+            "display_size": list(display_size),
+            "mapping": mapping_to_dict(mapping),
+            "max_retries": max_retries,
+            "timing": asdict(timing) if timing is not None else None,
+        }
+        self._send_request(encode_message(request, self.codec))
+        with self._send_lock:
+            self._in_batch = True
+            self._batch_callback = on_result
+        try:
+            sock = self._connect()
+            while True:
+                reply, _ = read_message(sock)
+                kind = reply.get("type")
+                if kind == "result":
+                    logger.info("Daemon executed action %s (%s): %s in %.1fms", reply["index"] + 1,
+                                reply["action"], "ok" if reply["ok"] else "failed", reply["elapsed_ms"])
+                    if on_result is not None:
+                        on_result(reply["index"], reply["action"], reply["ok"], reply["elapsed_ms"] / 1000)
+                elif kind == "done":
+                    logger.info("Daemon batch %s: %s successful in %.1fms",
+                                "cancelled" if reply.get("cancelled") else "complete",
+                                reply["successful"], reply["elapsed_ms"])
+                    return int(reply["successful"])
+                else:
+                    raise ProtocolError(reply.get("message", f"Unexpected reply: {kind}"))
+        except BaseException:
+            # Do not leave the daemon running a batch nobody is waiting for
+            self.cancel()
+            self._end_batch()
+            # The stream position is unknown after a failure, so start over next time
+            self.close()
+            raise
+        finally:
+            self._end_batch()
+
+    def _end_batch(self) -> None:
+        with self._send_lock:
+            self._in_batch = False
+            self._batch_callback = None
+
+
+def main() -> None:
+    """Run the executor daemon until interrupted."""
+    parser = argparse.ArgumentParser(description="Self Flow executor daemon")
+    parser.add_argument("--socket", default=os.getenv("SELF_FLOW_EXECUTOR_SOCKET") or DEFAULT_SOCKET_PATH,
+                        help="Unix socket path to listen on")
+    args = parser.parse_args()
+
+    server = ExecutorDaemon(args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Executor daemon stopping")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,54 @@
-from typing import Tuple
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, FrozenSet, List, Optional, Tuple
+import os
+import subprocess
 from .logger import setup_logger
 
 logger = setup_logger(__name__)
 
+CAPTURE_MODES = ("full", "monitor", "window", "rect")
+
+
+@dataclass(frozen=True)
+class CoordinateMapping:
+    """Maps coordinates in the image sent to Claude back to screen coordinates."""
+    scale_x: float = 1.0
+    scale_y: float = 1.0
+    origin_x: int = 0
+    origin_y: int = 0
+    # Optional screen-space adjustment for click targets, e.g. snapping to elements
+    snap: Optional[Callable[[int, int], Tuple[int, int]]] = field(default=None, compare=False)
+
+    def to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        """Convert an image pixel to the screen pixel under its center."""
+        return (self.origin_x + int((x + 0.5) * self.scale_x),
+                self.origin_y + int((y + 0.5) * self.scale_y))
+
+    def from_screen(self, x: int, y: int) -> Tuple[int, int]:
+        """Convert a screen pixel to the image pixel that covers it."""
+        return int((x - self.origin_x) / self.scale_x), int((y - self.origin_y) / self.scale_y)
+
+
+@dataclass(frozen=True)
+class CaptureRegion:
+    """A rectangle of the virtual screen, in screen coordinates."""
+    left: int
+    top: int
+    width: int
+    height: int
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def origin(self) -> Tuple[int, int]:
+        return self.left, self.top
+
+    def as_tuple(self) -> Tuple[int, int, int, int]:
+        return self.left, self.top, self.width, self.height
+
 
 def get_primary_display_size() -> Tuple[int, int]:
     """Get the primary display dimensions."""
@@ -26,24 +72,172 @@ def get_primary_display_size() -> Tuple[int, int]:
         return fallback_size
 
 
-def take_screenshot() -> str:
-    """Take a screenshot of the current screen and save it as screenshot.png in the project root."""
-    logger.info("Taking screenshot of current screen")
+def list_monitors() -> List[CaptureRegion]:
+    """List the bounds of each physical monitor.
+    
+    Uses mss when it is installed; otherwise only the primary display is known.
+    """
+    logger.debug("Enumerating monitors")
+    
+    try:
+        import mss
+        
+        with mss.mss() as sct:
+            # Index 0 is the combined virtual screen; the rest are physical monitors
+            monitors = [
+                CaptureRegion(m["left"], m["top"], m["width"], m["height"])
+                for m in sct.monitors[1:]
+            ]
+        logger.debug("Found %s monitor(s): %s", len(monitors), monitors)
+        return monitors
+    except ImportError:
+        logger.debug("mss not available, falling back to the primary display")
+    except Exception as e:
+        logger.warning("Failed to enumerate monitors: %s", e)
+    
+    width, height = get_primary_display_size()
+    return [CaptureRegion(0, 0, width, height)]
+
+
+@lru_cache(maxsize=1)
+def own_process_ids() -> FrozenSet[int]:
+    """Return the ids of this process and its ancestors, e.g. the terminal emulator running it."""
+    pids = {os.getpid(), os.getppid()}
+    pid = os.getppid()
+    while pid > 1:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                pid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            break
+        pids.add(pid)
+    return frozenset(pids)
+
+
+def _active_window_pid() -> Optional[int]:
+    """Return the process id owning the focused X11 window, if xdotool can tell."""
+    try:
+        output = subprocess.run(
+            ["xdotool", "getactivewindow", "getwindowpid"],
+            capture_output=True, text=True, timeout=1.0, check=True,
+        ).stdout
+        return int(output.strip())
+    except Exception as e:
+        logger.debug("xdotool cannot report the active window's process: %s", e)
+        return None
+
+
+def get_active_window_region() -> Optional[CaptureRegion]:
+    """Return the bounds of the focused window, or None if they cannot be determined.
+    
+    On X11 the terminal running Self Flow is not accepted as the active window,
+    since it has focus right after an instruction is typed. Elsewhere focus
+    must be returned to the target application before capturing.
+    """
+    logger.debug("Detecting active window bounds")
+    
+    try:
+        import pyautogui
+        
+        window = pyautogui.getActiveWindow()
+        if window is not None and window.width > 0 and window.height > 0:
+            region = CaptureRegion(int(window.left), int(window.top), int(window.width), int(window.height))
+            logger.debug("Active window bounds from PyAutoGUI: %s", region)
+            return region
+    except Exception as e:
+        logger.debug("PyAutoGUI cannot report the active window: %s", e)
+    
+    # X11 fallback
+    try:
+        output = subprocess.run(
+            ["xdotool", "getactivewindow", "getwindowgeometry", "--shell"],
+            capture_output=True, text=True, timeout=1.0, check=True,
+        ).stdout
+        values = dict(line.split("=", 1) for line in output.splitlines() if "=" in line)
+        region = CaptureRegion(int(values["X"]), int(values["Y"]), int(values["WIDTH"]), int(values["HEIGHT"]))
+        if _active_window_pid() in own_process_ids():
+            logger.warning("The active window is the terminal running Self Flow; "
+                           "focus the target application to capture it")
+            return None
+        logger.debug("Active window bounds from xdotool: %s", region)
+        return region
+    except Exception as e:
+        logger.debug("xdotool cannot report the active window: %s", e)
+    
+    logger.warning("Could not determine the active window bounds")
+    return None
+
+
+def resolve_capture_region(mode: str, monitor: int = 0,
+                           rect: Optional[Tuple[int, int, int, int]] = None) -> Optional[CaptureRegion]:
+    """Resolve a capture mode to a screen region.
+    
+    Returns None for a full-screen capture, which is also the fallback when
+    the requested region cannot be resolved.
+    """
+    logger.debug("Resolving capture region for mode: %s", mode)
+    
+    if mode == "monitor":
+        monitors = list_monitors()
+        if 0 <= monitor < len(monitors):
+            return monitors[monitor]
+        logger.warning("Monitor %s not found (%s available), capturing full screen", monitor, len(monitors))
+    elif mode == "window":
+        region = get_active_window_region()
+        if region is not None:
+            return region
+        logger.warning("Falling back to full screen capture")
+    elif mode == "rect":
+        if rect and rect[2] > 0 and rect[3] > 0:
+            return CaptureRegion(*rect)
+        logger.warning("Invalid capture rectangle %s, capturing full screen", rect)
+    elif mode != "full":
+        logger.warning("Unknown capture mode '%s', capturing full screen", mode)
+    
+    return None
+
+
+def _grab_region(region: CaptureRegion):
+    """Grab a screen region as a PIL image, preferring mss for multi-monitor support."""
+    try:
+        import mss
+        from PIL import Image
+        
+        with mss.mss() as sct:
+            shot = sct.grab({"left": region.left, "top": region.top,
+                             "width": region.width, "height": region.height})
+            return Image.frombytes("RGB", shot.size, shot.rgb)
+    except ImportError:
+        import pyautogui
+        return pyautogui.screenshot(region=region.as_tuple())
+
+
+def take_screenshot(region: Optional[CaptureRegion] = None, output_path: str = "screenshot.png") -> str:
+    """Take a screenshot and save it to ``output_path``, by default screenshot.png in the project root.
+    
+    Captures the whole screen, or only ``region`` when one is given.
+    """
+    logger.info("Taking screenshot of %s", f"region {region.as_tuple()}" if region else "current screen")
     
     try:
         import pyautogui
         
-        # Save screenshot as screenshot.png in the current working directory
-        screenshot_path = "screenshot.png"
+        screenshot_path = output_path
         logger.debug("Screenshot will be saved to: %s", screenshot_path)
         
         # Take screenshot
-        logger.debug("Capturing screenshot using PyAutoGUI")
-        screenshot = pyautogui.screenshot()
+        if region is not None:
+            logger.debug("Capturing screen region %s", region)
+            screenshot = _grab_region(region)
+        else:
+            logger.debug("Capturing screenshot using PyAutoGUI")
+            screenshot = pyautogui.screenshot()
         
         # Save the screenshot
         logger.debug("Saving screenshot to disk")
         screenshot.save(screenshot_path)
+        screenshot.close()
         
         # Get file size for logging
         import os
@@ -62,3 +256,82 @@ def take_screenshot() -> str:
         raise RuntimeError(error_msg)
 
 
+def _save_image(image, output_path: str, quality: int = 85) -> None:
+    """Save an image in the format implied by ``output_path``'s extension."""
+    if output_path.lower().endswith((".jpg", ".jpeg")):
+        # JPEG has no alpha channel
+        if image.mode != "RGB":
+            converted = image.convert("RGB")
+            converted.save(output_path, quality=quality)
+            converted.close()
+        else:
+            image.save(output_path, quality=quality)
+    else:
+        image.save(output_path)
+
+
+def get_image_size(path: str) -> Tuple[int, int]:
+    """Return the (width, height) of an image file without decoding its pixels."""
+    from PIL import Image
+    
+    with Image.open(path) as image:
+        return image.size
+
+
+def downscale_screenshot(path: str, size: Tuple[int, int], output_path: str = "screenshot_scaled.png",
+                         quality: int = 85) -> str:
+    """Resize a screenshot to ``size`` and return the path of the resized copy.
+    
+    The copy is saved as JPEG at ``quality`` when ``output_path`` ends in
+    ``.jpg`` and as PNG otherwise.
+    """
+    width, height = max(1, int(size[0])), max(1, int(size[1]))
+    logger.info("Downscaling screenshot %s to %sx%s", path, width, height)
+    
+    try:
+        from PIL import Image
+        
+        with Image.open(path) as image:
+            resized = image.resize((width, height), Image.LANCZOS)
+        _save_image(resized, output_path, quality)
+        resized.close()
+        
+        logger.info("Downscaled screenshot saved: %s", output_path)
+        return output_path
+    except Exception as e:
+        error_msg = f"Failed to downscale screenshot: {e}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+
+
+def crop_screenshot(path: str, box: Tuple[int, int, int, int], max_edge: int = 0,
+                    output_path: str = "screenshot_crop.png", quality: int = 85) -> Tuple[str, Tuple[int, int]]:
+    """Crop ``box`` (left, top, right, bottom in image pixels) out of a screenshot.
+    
+    The crop is shrunk to ``max_edge`` pixels on its longest side when that
+    limit is set. Returns the path and size of the saved crop.
+    """
+    logger.info("Cropping screenshot %s to box %s", path, box)
+    
+    try:
+        from PIL import Image
+        
+        with Image.open(path) as image:
+            crop = image.crop(box)
+        if max_edge and max(crop.size) > max_edge:
+            factor = max_edge / max(crop.size)
+            resized = crop.resize((max(1, int(crop.width * factor)), max(1, int(crop.height * factor))), Image.LANCZOS)
+            crop.close()
+            crop = resized
+        size = crop.size
+        _save_image(crop, output_path, quality)
+        crop.close()
+        
+        logger.info("Cropped screenshot saved: %s (%sx%s)", output_path, *size)
+        return output_path, size
+    except Exception as e:
+        error_msg = f"Failed to crop screenshot: {e}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+
+
@@ -0,0 +1,179 @@
+"""Asynchronous engine for embedding Self Flow in asyncio applications.
+
+The engine drives the same pipeline steps as ``run_instruction``. Requests
+go through ``AsyncAnthropic`` on the event loop. Capture and input run on
+one process-wide display thread, so engines never interleave actions or
+capture mid-action. Encoding, scaling and recording run on the loop's
+default executor. Each stage has its own timeout::
+
+    async with AsyncEngine(load_settings()) as engine:
+        result = await engine.run("click the login button")
+
+Attach a ``FlightRecorder`` or ``ExecutorClient`` to ``engine.session`` the
+way ``main.py`` does to use them.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, Tuple, TypeVar
+import asyncio
+import functools
+import itertools
+import threading
+import anthropic
+from .accessibility import AccessibilityProvider
+from .anthropic_client import build_async_client, count_request_tokens_async, create_computer_use_request_async
+from .config import Settings
+from .display import get_primary_display_size
+from .logger import setup_logger
+from .router import ModelRouter
+from .session import (
+    STEP_COUNT,
+    STEP_CREATE,
+    STEP_DISPLAY,
+    STEP_STAGE,
+    InstructionResult,
+    Session,
+    Step,
+    instruction_steps,
+)
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+_engine_ids = itertools.count(1)
+_display_executor: Optional[ThreadPoolExecutor] = None
+_display_executor_lock = threading.Lock()
+
+
+def get_display_executor() -> ThreadPoolExecutor:
+    """Return the process-wide single-thread executor that owns the display."""
+    global _display_executor
+    with _display_executor_lock:
+        if _display_executor is None:
+            _display_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="self-flow-display")
+        return _display_executor
+
+
+class StageTimeout(TimeoutError):
+    """Raised when a pipeline stage does not finish within its timeout."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"{stage} stage timed out after {timeout:.1f}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class ExecutionCancelled(Exception):
+    """Raised between actions to stop the batch of a cancelled instruction."""
+
+
+class AsyncEngine:
+    """Runs instructions for one session without blocking the event loop.
+
+    An engine processes one instruction at a time; create one engine per
+    concurrent session and share an ``AsyncAnthropic`` client between them.
+    Cancelling ``run`` or hitting a timeout stops action execution before
+    the next action, in-process or on an executor daemon, since an action
+    already sent to the input backend cannot be taken back.
+    """
+
+    def __init__(self, settings: Settings, client: Optional[anthropic.AsyncAnthropic] = None,
+                 display_size: Optional[Tuple[int, int]] = None,
+                 display_executor: Optional[ThreadPoolExecutor] = None):
+        self.client = client or build_async_client(settings.anthropic_api_key)
+        self._owns_client = client is None
+        self.display_executor = display_executor or get_display_executor()
+        self.session = Session(
+            client=None,
+            settings=settings,
+            display_size=display_size or get_primary_display_size(),
+            router=ModelRouter(settings),
+            file_prefix=f"screenshot_engine{next(_engine_ids)}",
+        )
+        if settings.accessibility_mode != "off":
+            self.session.accessibility = AccessibilityProvider(
+                time_budget=settings.accessibility_time_budget,
+                cache_ttl=settings.accessibility_cache_ttl,
+            )
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> "AsyncEngine":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the API client if the engine created it."""
+        if self._owns_client:
+            await self.client.close()
+
+    async def _in_thread(self, executor: Optional[ThreadPoolExecutor], func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+    async def _stage(self, name: str, timeout: float, deadline: Optional[float], awaitable: Awaitable[T]) -> T:
+        """Await a step of a stage, raising ``StageTimeout`` once the stage's deadline passes."""
+        remaining = None if deadline is None else max(0.0, deadline - asyncio.get_running_loop().time())
+        try:
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            logger.error("Stage '%s' timed out after %.1fs", name, timeout)
+            raise StageTimeout(name, timeout) from None
+
+    async def _perform(self, step: Step) -> Any:
+        """Run one pipeline step without blocking the event loop."""
+        if step.kind == STEP_CREATE:
+            return await create_computer_use_request_async(self.client, **step.params)
+        if step.kind == STEP_COUNT:
+            return await count_request_tokens_async(self.client, step.params)
+        executor = self.display_executor if step.kind == STEP_DISPLAY else None
+        return await self._in_thread(executor, step.func, *step.args)
+
+    async def run(self, instruction_text: str) -> InstructionResult:
+        """Capture the screen, ask Claude for actions and execute them.
+
+        Behaves like ``run_instruction``, including escalation to the strong
+        model. Raises ``StageTimeout`` when a stage exceeds its timeout.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            return await self._run(instruction_text)
+
+    async def _run(self, instruction_text: str) -> InstructionResult:
+        """Drive ``instruction_steps``, timing each stage as a whole."""
+        settings = self.session.settings
+        timeouts = {"capture": settings.capture_timeout, "request": settings.request_timeout,
+                    "execute": settings.execute_timeout}
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+
+        def on_result(index: int, action: str, success: bool, elapsed: float) -> None:
+            if cancelled.is_set():
+                raise ExecutionCancelled(f"Stopped after action {index + 1} ({action})")
+
+        steps = instruction_steps(self.session, instruction_text, on_result=on_result)
+        stage, timeout, deadline = "", 0.0, None
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+            value, error = None, None
+            if step.kind == STEP_STAGE:
+                stage, timeout = step.name, timeouts.get(step.name, 0.0)
+                deadline = loop.time() + timeout if timeout > 0 else None
+                continue
+            try:
+                value = await self._stage(stage, timeout, deadline, self._perform(step))
+            except BaseException as e:
+                # A batch still queued or running on the display thread stops at its next action
+                cancelled.set()
+                if self.session.executor is not None:
+                    # A daemon batch is not waiting for a result to be handled, so stop it directly
+                    self.session.executor.cancel(on_result)
+                error = e
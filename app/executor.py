@@ -1,14 +1,34 @@
 """Executor for computer automation actions."""
 
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import time
+from .display import CoordinateMapping
 from .logger import setup_logger
 
 logger = setup_logger(__name__)
 
 
-def validate_coordinate(coord: Any, display_size: Tuple[int, int]) -> Optional[Tuple[int, int]]:
-    """Validate and return coordinate tuple if valid."""
+@dataclass(frozen=True)
+class ActionTiming:
+    """Delays and tween durations used when executing actions, in seconds."""
+    click_delay: float = 0.2
+    settle_delay: float = 0.1
+    move_duration: float = 0.25
+    drag_duration: float = 0.5
+    retry_delay: float = 0.5
+
+
+DEFAULT_ACTION_TIMING = ActionTiming()
+
+
+def validate_coordinate(coord: Any, display_size: Tuple[int, int],
+                        mapping: Optional[CoordinateMapping] = None) -> Optional[Tuple[int, int]]:
+    """Validate a coordinate against the image bounds and return it in screen space.
+    
+    ``display_size`` is the size of the image Claude saw. When a ``mapping`` is
+    given the validated coordinate is converted to screen coordinates.
+    """
     logger.debug("Validating coordinate: %s (Type: %s)", coord, type(coord).__name__)
     
     if isinstance(coord, list) and len(coord) == 2:
@@ -21,6 +41,10 @@ def validate_coordinate(coord: Any, display_size: Tuple[int, int]) -> Optional[T
             
             if 0 <= x < width and 0 <= y < height:
                 logger.debug("Coordinates (%s, %s) are valid", x, y)
+                if mapping is not None:
+                    screen_x, screen_y = mapping.to_screen(x, y)
+                    logger.debug("Mapped coordinates (%s, %s) to screen (%s, %s)", x, y, screen_x, screen_y)
+                    return (screen_x, screen_y)
                 return (x, y)
             else:
                 logger.warning("Coordinates (%s, %s) out of bounds (%sx%s)", x, y, width, height)
@@ -37,6 +61,16 @@ def validate_coordinate(coord: Any, display_size: Tuple[int, int]) -> Optional[T
         return None
 
 
+def snap_click_target(coordinate: Tuple[int, int], mapping: Optional[CoordinateMapping]) -> Tuple[int, int]:
+    """Adjust a screen click target with the mapping's snap function, if any."""
+    if mapping is None or mapping.snap is None:
+        return coordinate
+    snapped = mapping.snap(*coordinate)
+    if snapped != coordinate:
+        logger.info("Snapped click target %s to %s", coordinate, snapped)
+    return snapped
+
+
 def validate_action_parameters(action: str, tool_input: Dict[str, Any], display_size: Tuple[int, int]) -> bool:
     """Validate action parameters before execution."""
     logger.debug("Validating action parameters for: %s", action)
@@ -64,20 +98,22 @@ def validate_action_parameters(action: str, tool_input: Dict[str, Any], display_
     return True
 
 
-def handle_left_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_left_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                      mapping: Optional[CoordinateMapping] = None,
+                      timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle left click action."""
     logger.info("Executing left_click action")
-    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size)
+    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size, mapping)
     if not coordinate:
         logger.error("Invalid coordinate for left_click: %s", tool_input.get("coordinate"))
         return False
     
-    x, y = coordinate
+    x, y = snap_click_target(coordinate, mapping)
     logger.debug("Left clicking at coordinates (%s, %s)", x, y)
     
     try:
-        logger.debug("Waiting 0.2 seconds before click")
-        time.sleep(0.2)
+        logger.debug("Waiting %s seconds before click", timing.click_delay)
+        time.sleep(timing.click_delay)
         
         logger.debug("Executing pyautogui.click(%s, %s)", x, y)
         pyautogui.click(x, y)
@@ -89,20 +125,22 @@ def handle_left_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple
         return False
 
 
-def handle_right_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_right_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                       mapping: Optional[CoordinateMapping] = None,
+                       timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle right click action."""
     logger.info("Executing right_click action")
-    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size)
+    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size, mapping)
     if not coordinate:
         logger.error("Invalid coordinate for right_click: %s", tool_input.get("coordinate"))
         return False
     
-    x, y = coordinate
+    x, y = snap_click_target(coordinate, mapping)
     logger.debug("Right clicking at coordinates (%s, %s)", x, y)
     
     try:
-        logger.debug("Waiting 0.2 seconds before right-click")
-        time.sleep(0.2)
+        logger.debug("Waiting %s seconds before right-click", timing.click_delay)
+        time.sleep(timing.click_delay)
         
         logger.debug("Executing pyautogui.rightClick(%s, %s)", x, y)
         pyautogui.rightClick(x, y)
@@ -114,20 +152,22 @@ def handle_right_click(tool_input: Dict[str, Any], pyautogui, display_size: Tupl
         return False
 
 
-def handle_double_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_double_click(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                        mapping: Optional[CoordinateMapping] = None,
+                        timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle double click action."""
     logger.info("Executing double_click action")
-    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size)
+    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size, mapping)
     if not coordinate:
         logger.error("Invalid coordinate for double_click: %s", tool_input.get("coordinate"))
         return False
     
-    x, y = coordinate
+    x, y = snap_click_target(coordinate, mapping)
     logger.debug("Double clicking at coordinates (%s, %s)", x, y)
     
     try:
-        logger.debug("Waiting 0.2 seconds before double-click")
-        time.sleep(0.2)
+        logger.debug("Waiting %s seconds before double-click", timing.click_delay)
+        time.sleep(timing.click_delay)
         
         logger.debug("Executing pyautogui.doubleClick(%s, %s)", x, y)
         pyautogui.doubleClick(x, y)
@@ -139,7 +179,9 @@ def handle_double_click(tool_input: Dict[str, Any], pyautogui, display_size: Tup
         return False
 
 
-def handle_type(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_type(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                mapping: Optional[CoordinateMapping] = None,
+                timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle type action."""
     logger.info("Executing type action")
     text = tool_input.get("text", "")
@@ -152,12 +194,12 @@ def handle_type(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int,
     coordinate = tool_input.get("coordinate")
     if coordinate:
         logger.debug("Coordinate provided for typing: %s", coordinate)
-        coord = validate_coordinate(coordinate, display_size)
+        coord = validate_coordinate(coordinate, display_size, mapping)
         if coord:
             x, y = coord
             logger.debug("Clicking at (%s, %s) before typing", x, y)
             pyautogui.click(x, y)
-            time.sleep(0.1)
+            time.sleep(timing.settle_delay)
         else:
             logger.warning("Invalid coordinate provided for typing, proceeding without clicking")
     else:
@@ -174,7 +216,9 @@ def handle_type(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int,
         return False
 
 
-def handle_key(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_key(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+               mapping: Optional[CoordinateMapping] = None,
+               timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle single key press action."""
     logger.info("Executing key press action")
     key = tool_input.get("key", "")
@@ -195,7 +239,9 @@ def handle_key(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, i
         return False
 
 
-def handle_key_combination(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_key_combination(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                           mapping: Optional[CoordinateMapping] = None,
+                           timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle key combination action."""
     logger.info("Executing key combination action")
     keys = tool_input.get("keys", [])
@@ -217,7 +263,9 @@ def handle_key_combination(tool_input: Dict[str, Any], pyautogui, display_size:
         return False
 
 
-def handle_scroll(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_scroll(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                  mapping: Optional[CoordinateMapping] = None,
+                  timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle scroll action."""
     logger.info("Executing scroll action")
     coordinate = tool_input.get("coordinate")
@@ -228,12 +276,12 @@ def handle_scroll(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int
     
     if coordinate:
         logger.debug("Coordinate provided for scrolling: %s", coordinate)
-        coord = validate_coordinate(coordinate, display_size)
+        coord = validate_coordinate(coordinate, display_size, mapping)
         if coord:
             x, y = coord
             logger.debug("Moving to (%s, %s) before scrolling", x, y)
             pyautogui.moveTo(x, y)
-            time.sleep(0.1)
+            time.sleep(timing.settle_delay)
         else:
             logger.warning("Invalid coordinate provided for scrolling, proceeding at current position")
     else:
@@ -254,10 +302,12 @@ def handle_scroll(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int
         return False
 
 
-def handle_move(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_move(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                mapping: Optional[CoordinateMapping] = None,
+                timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle move action."""
     logger.info("Executing move action")
-    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size)
+    coordinate = validate_coordinate(tool_input.get("coordinate"), display_size, mapping)
     if not coordinate:
         logger.error("Invalid coordinate for move: %s", tool_input.get("coordinate"))
         return False
@@ -266,8 +316,8 @@ def handle_move(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int,
     logger.debug("Moving cursor to coordinates (%s, %s)", x, y)
     
     try:
-        logger.debug("Executing pyautogui.moveTo(%s, %s, duration=0.25)", x, y)
-        pyautogui.moveTo(x, y, duration=0.25)
+        logger.debug("Executing pyautogui.moveTo(%s, %s, duration=%s)", x, y, timing.move_duration)
+        pyautogui.moveTo(x, y, duration=timing.move_duration)
         
         logger.info("Cursor moved successfully to (%s, %s)", x, y)
         return True
@@ -276,11 +326,13 @@ def handle_move(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int,
         return False
 
 
-def handle_drag(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_drag(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                mapping: Optional[CoordinateMapping] = None,
+                timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle drag action."""
     logger.info("Executing drag action")
-    start_coord = validate_coordinate(tool_input.get("start_coordinate"), display_size)
-    end_coord = validate_coordinate(tool_input.get("end_coordinate"), display_size)
+    start_coord = validate_coordinate(tool_input.get("start_coordinate"), display_size, mapping)
+    end_coord = validate_coordinate(tool_input.get("end_coordinate"), display_size, mapping)
     
     if not start_coord or not end_coord:
         logger.error("Invalid coordinates for drag: start=%s, end=%s", 
@@ -295,12 +347,12 @@ def handle_drag(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int,
     try:
         logger.debug("Moving to start position (%s, %s)", start_x, start_y)
         pyautogui.moveTo(start_x, start_y)
-        time.sleep(0.1)
+        time.sleep(timing.settle_delay)
         
         delta_x = end_x - start_x
         delta_y = end_y - start_y
-        logger.debug("Executing pyautogui.drag(%s, %s, duration=0.5)", delta_x, delta_y)
-        pyautogui.drag(delta_x, delta_y, duration=0.5)
+        logger.debug("Executing pyautogui.drag(%s, %s, duration=%s)", delta_x, delta_y, timing.drag_duration)
+        pyautogui.drag(delta_x, delta_y, duration=timing.drag_duration)
         
         logger.info("Drag executed successfully from (%s, %s) to (%s, %s)", start_x, start_y, end_x, end_y)
         return True
@@ -310,7 +362,9 @@ def handle_drag(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int,
         return False
 
 
-def handle_wait(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int]) -> bool:
+def handle_wait(tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int],
+                mapping: Optional[CoordinateMapping] = None,
+                timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Handle wait action."""
     logger.info("Executing wait action")
     duration = tool_input.get("duration", 1.0)
@@ -347,21 +401,23 @@ ACTION_HANDLERS = {
 }
 
 
-def execute_action_with_retry(action: str, tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int], max_retries: int = 2) -> bool:
+def execute_action_with_retry(action: str, tool_input: Dict[str, Any], pyautogui, display_size: Tuple[int, int], max_retries: int = 2,
+                              mapping: Optional[CoordinateMapping] = None,
+                              timing: ActionTiming = DEFAULT_ACTION_TIMING) -> bool:
     """Execute an action with retry logic."""
     logger.debug("Executing action '%s' with max retries: %s", action, max_retries)
     
     for attempt in range(max_retries + 1):
         try:
-            if ACTION_HANDLERS[action](tool_input, pyautogui, display_size):
+            if ACTION_HANDLERS[action](tool_input, pyautogui, display_size, mapping, timing):
                 return True
             elif attempt < max_retries:
                 logger.warning("Action %s failed, retrying... (attempt %s/%s)", action, attempt + 1, max_retries)
-                time.sleep(0.5)
+                time.sleep(timing.retry_delay)
         except Exception as e:
             if attempt < max_retries:
                 logger.warning("Exception during %s, retrying... (attempt %s/%s): %s", action, attempt + 1, max_retries, e)
-                time.sleep(0.5)
+                time.sleep(timing.retry_delay)
             else:
                 logger.error("Action %s failed after %s attempts: %s", action, max_retries + 1, e)
                 return False
@@ -369,50 +425,70 @@ def execute_action_with_retry(action: str, tool_input: Dict[str, Any], pyautogui
     return False
 
 
-def execute_tool_use_actions(message: Any, display_size: Tuple[int, int], max_retries: int = 2) -> int:
-    """Execute computer-use tool actions."""
-    logger.info("Starting execution of tool use actions")
-    logger.debug("Display size: %sx%s", *display_size)
-    logger.debug("Max retries per action: %s", max_retries)
-    
+def extract_computer_actions(message: Any) -> List[Dict[str, Any]]:
+    """Return the inputs of all computer tool_use blocks in a response."""
+    content_blocks = getattr(message, "content", []) or []
+    return [
+        getattr(block, "input", {}) or {}
+        for block in content_blocks
+        if getattr(block, "type", None) == "tool_use" and getattr(block, "name", None) == "computer"
+    ]
+
+
+def count_valid_actions(message: Any, display_size: Tuple[int, int]) -> int:
+    """Count the actions in a response that are known and pass validation."""
+    valid = 0
+    for tool_input in extract_computer_actions(message):
+        action = tool_input.get("action")
+        if action in ACTION_HANDLERS and validate_action_parameters(action, tool_input, display_size):
+            valid += 1
+    logger.debug("Response contains %s valid action(s)", valid)
+    return valid
+
+
+def load_pyautogui() -> Optional[Any]:
+    """Import and configure PyAutoGUI, or return None if it is unavailable."""
     try:
         import pyautogui
         pyautogui.FAILSAFE = True
         logger.info("PyAutoGUI loaded successfully")
         logger.debug("PyAutoGUI version: %s", pyautogui.__version__)
         logger.debug("Failsafe enabled: %s", pyautogui.FAILSAFE)
+        return pyautogui
     except Exception as e:
         logger.warning("pyautogui not available; cannot execute actions: %s", e)
-        return 0
+        return None
 
-    content_blocks = getattr(message, "content", []) or []
-    tool_use_blocks = []
-    
-    # Collect all tool_use blocks
-    for block in content_blocks:
-        if getattr(block, "type", None) == "tool_use" and getattr(block, "name", None) == "computer":
-            tool_use_blocks.append(block)
+
+def execute_actions(tool_inputs: List[Dict[str, Any]], pyautogui, display_size: Tuple[int, int],
+                    max_retries: int = 2, mapping: Optional[CoordinateMapping] = None,
+                    on_result: Optional[Callable[[int, str, bool, float], None]] = None,
+                    timing: ActionTiming = DEFAULT_ACTION_TIMING) -> int:
+    """Validate and execute a batch of computer actions.
     
-    if not tool_use_blocks:
+    ``timing`` sets the delays and durations between input events.
+    ``on_result`` is called after each executed action with its index in
+    ``tool_inputs``, the action name, whether it succeeded and the elapsed
+    seconds. Returns the number of successful actions.
+    """
+    if not tool_inputs:
         logger.info("No computer actions found in the response")
         return 0
     
-    logger.info("Found %s action(s) to execute", len(tool_use_blocks))
+    logger.info("Found %s action(s) to execute", len(tool_inputs))
     
     # Log all actions for debugging
-    for i, block in enumerate(tool_use_blocks):
-        tool_input = getattr(block, "input", {}) or {}
+    for i, tool_input in enumerate(tool_inputs):
         action = tool_input.get("action", "unknown")
         logger.debug("Action %s: %s with params: %s", i+1, action, tool_input)
     
     executed_actions = 0
     successful_actions = 0
     
-    for i, block in enumerate(tool_use_blocks, 1):
-        tool_input = getattr(block, "input", {}) or {}
+    for i, tool_input in enumerate(tool_inputs):
         action = tool_input.get("action")
         
-        logger.info("Processing action %s/%s: %s", i, len(tool_use_blocks), action)
+        logger.info("Processing action %s/%s: %s", i + 1, len(tool_inputs), action)
         
         if action not in ACTION_HANDLERS:
             logger.warning("Unknown action type: %s", action)
@@ -431,18 +507,46 @@ def execute_tool_use_actions(message: Any, display_size: Tuple[int, int], max_re
         # Execute the action
         executed_actions += 1
         logger.info("Executing action: %s with params: %s", action, tool_input)
+        started = time.perf_counter()
+        success = False
         
         try:
-            if execute_action_with_retry(action, tool_input, pyautogui, display_size, max_retries):
+            if execute_action_with_retry(action, tool_input, pyautogui, display_size, max_retries, mapping, timing):
+                success = True
                 successful_actions += 1
                 logger.info("Action '%s' completed successfully", action)
             else:
                 logger.warning("Action '%s' failed", action)
         except Exception as e:
             logger.error("Exception during action %s: %s", action, e)
+        
+        if on_result is not None:
+            on_result(i, action, success, time.perf_counter() - started)
     
     logger.info("Action execution complete: %s/%s successful (%.1f%%)", 
                 successful_actions, executed_actions, 
                 (successful_actions/executed_actions*100) if executed_actions > 0 else 0)
     
     return successful_actions
+
+
+def execute_tool_use_actions(message: Any, display_size: Tuple[int, int], max_retries: int = 2,
+                             mapping: Optional[CoordinateMapping] = None,
+                             on_result: Optional[Callable[[int, str, bool, float], None]] = None,
+                             timing: ActionTiming = DEFAULT_ACTION_TIMING) -> int:
+    """Execute computer-use tool actions.
+    
+    ``display_size`` is the size of the screenshot sent with the request and
+    ``mapping`` converts coordinates in that screenshot to screen coordinates.
+    ``on_result`` and ``timing`` are passed on to ``execute_actions``.
+    """
+    logger.info("Starting execution of tool use actions")
+    logger.debug("Display size: %sx%s", *display_size)
+    logger.debug("Max retries per action: %s", max_retries)
+    
+    pyautogui = load_pyautogui()
+    if pyautogui is None:
+        return 0
+    
+    return execute_actions(extract_computer_actions(message), pyautogui, display_size, max_retries, mapping, on_result,
+                           timing)
@@ -0,0 +1,240 @@
+"""Asynchronous front end that queues instructions while earlier ones run.
+
+Instructions are read from stdin on a background thread, so the user can keep
+typing while the pipeline works. One worker runs them in order, starting the
+next instruction as soon as the previous one finishes, so the user's typing
+never holds up the pipeline.
+
+Nothing else of the next request is prefetched. Its screenshot, element list
+and token budget depend on the screen after the previous instruction's
+actions. Its model and adaptive max_tokens depend on the previous outcome,
+which feeds the router and the max_tokens advisor. A choice made earlier
+would be stale or made on another thread. The API client keeps its HTTP
+connection open between requests, so there is no connection to warm up
+either.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import asyncio
+import threading
+import time
+from .config import ProfileWatcher
+from .logger import setup_logger
+from .session import InstructionResult, Session, apply_settings, run_instruction
+from .ui import is_dump_command, is_status_command, parse_cancel_command, should_quit
+
+logger = setup_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Finished items kept for the status listing
+MAX_FINISHED_ITEMS = 20
+
+
+@dataclass
+class QueuedInstruction:
+    """An instruction waiting in, or taken from, the queue."""
+    id: int
+    text: str
+    status: str = QUEUED
+    model: Optional[str] = None
+    result: Optional[InstructionResult] = None
+    error: str = ""
+    queued_at: float = 0.0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    def describe(self) -> str:
+        """One-line status for display."""
+        line = f"[#{self.id}] {self.status:<9} {self.text!r}"
+        if self.status == RUNNING:
+            model = f"{self.model}, " if self.model else ""
+            line += f" ({model}{time.monotonic() - self.started_at:.1f}s)"
+        elif self.status == DONE and self.result is not None:
+            line += (f" ({self.result.actions_executed} action(s) with {self.result.model}"
+                     f" in {self.finished_at - self.started_at:.1f}s)")
+        elif self.status == FAILED:
+            line += f" ({self.error})"
+        return line
+
+
+class InstructionQueue:
+    """Accepts instructions continuously and runs them one at a time.
+
+    ``run`` drives the loop until the user quits or stdin closes. The
+    pipeline runs on a single worker thread, so the event loop stays free to
+    take commands: ``status`` lists the queue and ``cancel <id>`` drops a
+    pending instruction. A running instruction cannot be cancelled, because
+    its actions may already be partly executed.
+    """
+
+    def __init__(self, session: Session, profile_watcher: Optional[ProfileWatcher] = None):
+        self.session = session
+        self.profile_watcher = profile_watcher
+        self.items: Dict[int, QueuedInstruction] = {}
+        self.processed = 0
+        self._next_id = 1
+        # Created in run() so they belong to the running event loop
+        self._work: Optional["asyncio.Queue[QueuedInstruction]"] = None
+        self._lines: Optional["asyncio.Queue[Optional[str]]"] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="self-flow-pipeline")
+
+    def submit(self, text: str) -> QueuedInstruction:
+        """Queue an instruction to run after the ones already queued."""
+        item = QueuedInstruction(id=self._next_id, text=text, queued_at=time.monotonic())
+        self._next_id += 1
+        self.items[item.id] = item
+        self._work.put_nowait(item)
+        logger.info("Queued instruction #%s: '%s'", item.id, text)
+        print(f"Queued #{item.id} ({self.pending_count()} pending)")
+        return item
+
+    def cancel(self, item_id: int) -> bool:
+        """Cancel a pending instruction; returns False if it is not pending."""
+        item = self.items.get(item_id)
+        if item is None or item.status != QUEUED:
+            return False
+        item.status = CANCELLED
+        item.finished_at = time.monotonic()
+        logger.info("Cancelled instruction #%s", item_id)
+        return True
+
+    def cancel_pending(self) -> int:
+        """Cancel every pending instruction and return how many were cancelled."""
+        return sum(self.cancel(item.id) for item in list(self.items.values()) if item.status == QUEUED)
+
+    def pending_count(self) -> int:
+        return sum(1 for item in self.items.values() if item.status == QUEUED)
+
+    def status_lines(self) -> List[str]:
+        """Describe running and pending items and the most recently finished ones."""
+        active = [item for item in self.items.values() if item.status in (QUEUED, RUNNING)]
+        finished = [item for item in self.items.values() if item.status not in (QUEUED, RUNNING)]
+        return [item.describe() for item in finished[-5:] + active] or ["Queue is empty."]
+
+    def _prune(self) -> None:
+        finished = [item_id for item_id, item in self.items.items() if item.status not in (QUEUED, RUNNING)]
+        for item_id in finished[:-MAX_FINISHED_ITEMS]:
+            del self.items[item_id]
+
+    def _read_stdin(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Blocking reader thread feeding lines into the event loop."""
+        while True:
+            try:
+                line = input()
+            except (EOFError, KeyboardInterrupt):
+                loop.call_soon_threadsafe(self._lines.put_nowait, None)
+                return
+            loop.call_soon_threadsafe(self._lines.put_nowait, line.strip())
+
+    def _execute(self, item: QueuedInstruction) -> InstructionResult:
+        """Run one instruction on the worker thread.
+
+        The router and settings are only used from this thread, so profile
+        reloads and routing never race with a running instruction.
+        """
+        session = self.session
+        if self.profile_watcher is not None:
+            updated = self.profile_watcher.reload(session.settings)
+            if updated is not None:
+                apply_settings(session, updated)
+        item.model = session.router.choose_model(item.text)
+        try:
+            return run_instruction(session, item.text, item.model)
+        finally:
+            if session.memory is not None:
+                session.memory.after_instruction()
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._work.get()
+            try:
+                if item.status == CANCELLED:
+                    continue
+                item.status = RUNNING
+                item.started_at = time.monotonic()
+                print(item.describe())
+                try:
+                    item.result = await loop.run_in_executor(self._executor, self._execute, item)
+                    item.status = DONE
+                except Exception as e:
+                    logger.exception("Error processing instruction #%s: %s", item.id, e)
+                    item.status = FAILED
+                    item.error = str(e)
+                    self._dump_recorder(repr(e))
+                item.finished_at = time.monotonic()
+                self.processed += 1
+                print(item.describe())
+                self._prune()
+            finally:
+                self._work.task_done()
+
+    def _dump_recorder(self, reason: str) -> None:
+        recorder = self.session.recorder
+        if recorder is None:
+            return
+        try:
+            path = recorder.dump(self.session.settings.recorder_dir, reason=reason)
+            print(f"Recent history saved to {path}")
+        except Exception as e:
+            logger.error("Failed to dump flight recorder: %s", e)
+
+    def _handle_line(self, line: str) -> bool:
+        """Handle one input line; returns False when the user quits."""
+        if not line:
+            return True
+        if should_quit(line):
+            return False
+        if is_status_command(line):
+            print("\n".join(self.status_lines()))
+            return True
+        if is_dump_command(line):
+            if self.session.recorder is not None:
+                path = self.session.recorder.dump(self.session.settings.recorder_dir, reason="requested by user")
+                print(f"Flight recorder saved to {path}")
+            else:
+                print("Flight recorder is disabled.")
+            return True
+        item_id = parse_cancel_command(line)
+        if item_id is not None:
+            print(f"Cancelled #{item_id}" if self.cancel(item_id) else f"#{item_id} is not pending")
+            return True
+        self.submit(line)
+        return True
+
+    async def run(self) -> int:
+        """Read and process instructions until quit or end of input.
+
+        Returns the number of instructions that were run. On quit, pending
+        instructions are cancelled and the running one is allowed to finish.
+        """
+        loop = asyncio.get_running_loop()
+        self._work = asyncio.Queue()
+        self._lines = asyncio.Queue()
+        threading.Thread(target=self._read_stdin, args=(loop,), daemon=True,
+                         name="self-flow-stdin").start()
+        worker = asyncio.create_task(self._worker())
+        try:
+            while True:
+                line = await self._lines.get()
+                if line is None:
+                    # End of input: finish what was queued
+                    await self._work.join()
+                    break
+                if not self._handle_line(line):
+                    cancelled = self.cancel_pending()
+                    if cancelled:
+                        print(f"Cancelled {cancelled} pending instruction(s)")
+                    await self._work.join()
+                    break
+        finally:
+            worker.cancel()
+            self._executor.shutdown(wait=True)
+        return self.processed
@@ -0,0 +1,161 @@
+"""Memory instrumentation and footprint controls for long-running sessions."""
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import gc
+import os
+import sys
+import tracemalloc
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MB = 1024 * 1024
+TOP_MODULES = 10
+
+
+def get_rss_bytes() -> int:
+    """Return the current resident set size of this process, or 0 if unknown."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def _module_for_file(filename: str, modules: Dict[str, str]) -> str:
+    """Map a source file to its module name, falling back to the file name."""
+    return modules.get(filename, os.path.basename(filename))
+
+
+class MemoryMonitor:
+    """Tracks per-stage peaks, per-module growth and RSS ceilings.
+
+    tracemalloc is only started when ``tracing`` is on, since it slows every
+    allocation down. RSS checks are cheap and run after each instruction.
+    """
+
+    def __init__(self, tracing: bool = False, snapshot_interval: int = 20,
+                 rss_warn_mb: int = 0, rss_limit_mb: int = 0):
+        self.tracing = tracing
+        self.snapshot_interval = snapshot_interval
+        self.rss_warn_bytes = rss_warn_mb * MB
+        self.rss_limit_bytes = rss_limit_mb * MB
+        self.stage_peaks: Dict[str, int] = {}
+        self._evictions: List[Tuple[str, Callable[[], None]]] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._instructions = 0
+
+        if tracing and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            logger.info("tracemalloc started")
+        logger.info("Memory monitor initialized (tracing: %s, RSS warn: %s MB, RSS limit: %s MB)",
+                    tracing, rss_warn_mb or "off", rss_limit_mb or "off")
+
+    def register_eviction(self, name: str, callback: Callable[[], None]) -> None:
+        """Register a cache to clear when RSS exceeds the limit."""
+        self._evictions.append((name, callback))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure the peak memory of a pipeline stage.
+
+        With tracing, the peak of traced Python allocations is recorded;
+        otherwise the RSS growth across the stage.
+        """
+        if self.tracing and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            try:
+                yield
+            finally:
+                _, peak = tracemalloc.get_traced_memory()
+                self._record_stage(name, max(0, peak - before))
+        else:
+            before = get_rss_bytes()
+            try:
+                yield
+            finally:
+                self._record_stage(name, max(0, get_rss_bytes() - before))
+
+    def _record_stage(self, name: str, used: int) -> None:
+        logger.debug("Stage '%s' used %.2f MB", name, used / MB)
+        if used > self.stage_peaks.get(name, 0):
+            self.stage_peaks[name] = used
+
+    def after_instruction(self) -> None:
+        """Check RSS ceilings and take a periodic tracemalloc snapshot."""
+        self._instructions += 1
+        self.check_rss()
+        if self.tracing and self.snapshot_interval > 0 and self._instructions % self.snapshot_interval == 0:
+            self.snapshot_diff()
+
+    def check_rss(self) -> int:
+        """Warn or evict caches when RSS crosses the configured ceilings."""
+        rss = get_rss_bytes()
+        if not rss:
+            return 0
+        logger.debug("RSS: %.1f MB", rss / MB)
+        if self.rss_limit_bytes and rss > self.rss_limit_bytes:
+            logger.warning("RSS %.1f MB exceeds limit %.1f MB; evicting caches",
+                           rss / MB, self.rss_limit_bytes / MB)
+            for name, callback in self._evictions:
+                try:
+                    callback()
+                    logger.info("Evicted cache: %s", name)
+                except Exception as e:
+                    logger.error("Failed to evict cache %s: %s", name, e)
+            gc.collect()
+            rss = get_rss_bytes()
+            logger.info("RSS after eviction: %.1f MB", rss / MB)
+        elif self.rss_warn_bytes and rss > self.rss_warn_bytes:
+            logger.warning("RSS %.1f MB exceeds warning threshold %.1f MB",
+                           rss / MB, self.rss_warn_bytes / MB)
+        return rss
+
+    def snapshot_diff(self) -> List[Tuple[str, int]]:
+        """Compare a new snapshot with the previous one and log growth per module."""
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None:
+            logger.info("Baseline memory snapshot taken")
+            return []
+
+        modules = {
+            getattr(module, "__file__", None): name
+            for name, module in list(sys.modules.items())
+            if getattr(module, "__file__", None)
+        }
+        growth: Dict[str, int] = {}
+        for stat in snapshot.compare_to(previous, "filename"):
+            module = _module_for_file(stat.traceback[0].filename, modules)
+            growth[module] = growth.get(module, 0) + stat.size_diff
+
+        top = sorted(growth.items(), key=lambda item: item[1], reverse=True)[:TOP_MODULES]
+        logger.info("Memory growth since last snapshot (top %s modules):", len(top))
+        for module, size_diff in top:
+            logger.info("  %-40s %+.1f KB", module, size_diff / 1024)
+        return top
+
+    def summary(self) -> Dict[str, float]:
+        """Return peak memory per stage and current RSS in MB."""
+        result = {f"{name}_peak_mb": round(peak / MB, 2) for name, peak in self.stage_peaks.items()}
+        result["rss_mb"] = round(get_rss_bytes() / MB, 2)
+        return result
@@ -0,0 +1,154 @@
+"""In-memory flight recorder for recent frames, requests, responses and actions."""
+
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+import base64
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Record header: magic, kind, sequence number, timestamp, payload length
+RECORD_HEADER = struct.Struct(">2sBIdI")
+RECORD_MAGIC = b"SF"
+
+KIND_FRAME = 1
+KIND_REQUEST = 2
+KIND_RESPONSE = 3
+KIND_ACTIONS = 4
+KIND_NAMES = {KIND_FRAME: "frame", KIND_REQUEST: "request", KIND_RESPONSE: "response", KIND_ACTIONS: "actions"}
+
+FRAME_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+class FlightRecorder:
+    """Fixed-size ring buffer in an anonymous memory map.
+
+    Records are appended back to back and the oldest ones are overwritten
+    when the buffer wraps, so recording costs a memory copy and never
+    touches the disk. ``dump`` writes the surviving records out on demand.
+    Frames are stored as the already-compressed image bytes; other records
+    as zlib-compressed JSON.
+    """
+
+    def __init__(self, capacity_bytes: int = 64 * 1024 * 1024):
+        self.capacity = capacity_bytes
+        self._buffer = mmap.mmap(-1, capacity_bytes)
+        self._index: Deque[Tuple[int, int]] = deque()  # (offset, total length), oldest first
+        self._head = 0
+        self._seq = 0
+        self._last_frame: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        logger.info("Flight recorder initialized with %.1f MB", capacity_bytes / (1024 * 1024))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _append(self, kind: int, payload: bytes) -> None:
+        total = RECORD_HEADER.size + len(payload)
+        if total > self.capacity:
+            logger.warning("Record of %s bytes does not fit the %s byte recorder", total, self.capacity)
+            return
+
+        with self._lock:
+            if self._head + total > self.capacity:
+                # Wrap around; everything past the old head is the oldest data
+                while self._index and self._index[0][0] >= self._head:
+                    self._index.popleft()
+                self._head = 0
+            start, end = self._head, self._head + total
+            while self._index and self._index[0][0] < end and self._index[0][0] + self._index[0][1] > start:
+                self._index.popleft()
+
+            self._seq += 1
+            self._buffer[start:start + RECORD_HEADER.size] = RECORD_HEADER.pack(
+                RECORD_MAGIC, kind, self._seq, time.time(), len(payload))
+            self._buffer[start + RECORD_HEADER.size:end] = payload
+            self._index.append((start, total))
+            self._head = end
+
+    def _append_json(self, kind: int, data: Dict[str, Any]) -> None:
+        payload = json.dumps(data, default=str, separators=(",", ":")).encode("utf-8")
+        self._append(kind, zlib.compress(payload, 1))
+
+    def record_frame(self, image_b64: str, media_type: str = "image/png") -> None:
+        """Record a screenshot as sent; the same frame is only stored once."""
+        # Remember a fingerprint rather than the string, so the frame can be freed
+        fingerprint = (len(image_b64), hash(image_b64))
+        if fingerprint == self._last_frame:
+            return
+        self._last_frame = fingerprint
+        media = media_type.encode("ascii")
+        self._append(KIND_FRAME, bytes([len(media)]) + media + base64.b64decode(image_b64))
+
+    def record_request(self, **fields: Any) -> None:
+        """Record the parameters of a request, without its image data."""
+        self._append_json(KIND_REQUEST, fields)
+
+    def record_response(self, response: Any) -> None:
+        """Record an API response."""
+        if hasattr(response, "model_dump"):
+            data = response.model_dump(mode="json")
+        else:
+            data = {"content": repr(getattr(response, "content", response))}
+        self._append_json(KIND_RESPONSE, data)
+
+    def record_actions(self, actions: Any, successful: int) -> None:
+        """Record executed actions and how many succeeded."""
+        self._append_json(KIND_ACTIONS, {"actions": actions, "successful": successful})
+
+    def records(self) -> Iterator[Tuple[int, int, float, bytes]]:
+        """Yield (sequence, kind, timestamp, payload) for each record, oldest first."""
+        with self._lock:
+            entries = list(self._index)
+            for offset, total in entries:
+                magic, kind, seq, timestamp, length = RECORD_HEADER.unpack_from(self._buffer, offset)
+                if magic != RECORD_MAGIC:
+                    continue
+                start = offset + RECORD_HEADER.size
+                yield seq, kind, timestamp, bytes(self._buffer[start:start + length])
+
+    def _new_dump_directory(self, directory: str) -> str:
+        """Create a directory named after the current time, with millisecond resolution."""
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, stamp)
+        attempt = 1
+        while True:
+            try:
+                # Never merge into another dump, e.g. one written concurrently
+                os.mkdir(path)
+                return path
+            except FileExistsError:
+                attempt += 1
+                path = os.path.join(directory, f"{stamp}-{attempt}")
+
+    def dump(self, directory: str = "flight_records", reason: str = "") -> str:
+        """Write all records to a new timestamped directory and return its path."""
+        path = self._new_dump_directory(directory)
+        count = 0
+        for seq, kind, timestamp, payload in self.records():
+            name = f"{seq:06d}_{KIND_NAMES.get(kind, 'unknown')}"
+            if kind == KIND_FRAME:
+                media_length = payload[0]
+                media_type = payload[1:1 + media_length].decode("ascii")
+                with open(os.path.join(path, name + FRAME_EXTENSIONS.get(media_type, ".bin")), "wb") as f:
+                    f.write(payload[1 + media_length:])
+            else:
+                data = json.loads(zlib.decompress(payload))
+                data["_timestamp"] = timestamp
+                with open(os.path.join(path, name + ".json"), "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+            count += 1
+        if reason:
+            with open(os.path.join(path, "reason.txt"), "w", encoding="utf-8") as f:
+                f.write(reason + "\n")
+        logger.info("Flight recorder dumped %s record(s) to %s", count, path)
+        return path
@@ -0,0 +1,133 @@
+"""Model routing by instruction complexity with latency-aware fallback."""
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+import re
+from .config import Settings
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Weight of the newest sample in the latency moving average
+LATENCY_EMA_ALPHA = 0.3
+
+# Retry the fast model once every N simple instructions after it was benched,
+# so its statistics can recover
+FAST_MODEL_PROBE_INTERVAL = 20
+
+
+@dataclass
+class ModelStats:
+    """Observed latency and success rate for a single model."""
+    requests: int = 0
+    successes: int = 0
+    avg_latency: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.requests if self.requests else 0.0
+
+    def record(self, latency: float, success: bool) -> None:
+        """Record one request outcome."""
+        if self.requests == 0:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = LATENCY_EMA_ALPHA * latency + (1 - LATENCY_EMA_ALPHA) * self.avg_latency
+        self.requests += 1
+        if success:
+            self.successes += 1
+
+
+class ModelRouter:
+    """Route instructions to the fast or the strong model and learn from outcomes."""
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.stats: Dict[str, ModelStats] = {}
+        self._skipped_simple = 0
+        logger.info("Model router initialized (strong: %s, fast: %s, enabled: %s)",
+                    settings.model, settings.fast_model, settings.routing_enabled)
+
+    def _stats_for(self, model: str) -> ModelStats:
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    def is_simple(self, instruction_text: str) -> bool:
+        """Decide whether an instruction is simple enough for the fast model."""
+        words = re.findall(r"[\w']+", instruction_text.lower())
+        if not words:
+            return False
+        if len(words) > self.settings.routing_max_words:
+            logger.debug("Instruction has %s words (max %s for fast model)",
+                         len(words), self.settings.routing_max_words)
+            return False
+        complex_words = set(words) & set(self.settings.routing_complex_keywords)
+        if complex_words:
+            logger.debug("Instruction contains complex keywords: %s", sorted(complex_words))
+            return False
+        return True
+
+    def fast_model_worthwhile(self) -> bool:
+        """Check whether the fast model still pays off given observed stats.
+
+        The fast model is only worth trying while its expected latency,
+        including an escalation to the strong model when it fails, stays
+        below the latency of going to the strong model directly.
+        """
+        fast = self._stats_for(self.settings.fast_model)
+        if fast.requests < self.settings.routing_min_samples:
+            return True
+        if fast.success_rate < self.settings.routing_min_success_rate:
+            logger.info("Fast model success rate %.0f%% below threshold %.0f%%",
+                        fast.success_rate * 100, self.settings.routing_min_success_rate * 100)
+            return False
+        strong = self._stats_for(self.settings.model)
+        if strong.requests == 0:
+            return True
+        expected_latency = fast.avg_latency + (1 - fast.success_rate) * strong.avg_latency
+        if expected_latency >= strong.avg_latency:
+            logger.info("Fast model expected latency %.2fs not below strong model latency %.2fs",
+                        expected_latency, strong.avg_latency)
+            return False
+        return True
+
+    def choose_model(self, instruction_text: str) -> str:
+        """Pick the model for the first attempt at an instruction."""
+        if not self.settings.routing_enabled or self.settings.fast_model == self.settings.model:
+            return self.settings.model
+        if self.is_simple(instruction_text):
+            if self.fast_model_worthwhile():
+                logger.info("Routing instruction to fast model: %s", self.settings.fast_model)
+                return self.settings.fast_model
+            self._skipped_simple += 1
+            if self._skipped_simple >= FAST_MODEL_PROBE_INTERVAL:
+                self._skipped_simple = 0
+                logger.info("Probing fast model %s to refresh its statistics", self.settings.fast_model)
+                return self.settings.fast_model
+        logger.info("Routing instruction to strong model: %s", self.settings.model)
+        return self.settings.model
+
+    def escalation_model(self, model: str) -> Optional[str]:
+        """Return the model to escalate to after a failed attempt, if any."""
+        if model != self.settings.model:
+            return self.settings.model
+        return None
+
+    def record(self, model: str, latency: float, success: bool) -> None:
+        """Record the outcome of a request made with ``model``."""
+        stats = self._stats_for(model)
+        stats.record(latency, success)
+        logger.info("Model %s: %.2fs (avg %.2fs), success rate %.0f%% over %s request(s)",
+                    model, latency, stats.avg_latency, stats.success_rate * 100, stats.requests)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return per-model statistics for reporting."""
+        return {
+            model: {
+                "requests": stats.requests,
+                "success_rate": stats.success_rate,
+                "avg_latency": stats.avg_latency,
+            }
+            for model, stats in self.stats.items()
+        }
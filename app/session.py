@@ -0,0 +1,631 @@
+"""Per-instruction pipeline: capture, request, execute."""
+
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, TypeVar
+import math
+import os
+import time
+from .config import Settings
+from .router import ModelRouter
+from .tokens import (
+    COMPUTER_USE_OVERHEAD_TOKENS,
+    MaxTokensAdvisor,
+    TokenAccountant,
+    estimate_image_tokens,
+    estimate_text_tokens,
+    fit_image_to_budget,
+    trim_context_to_budget,
+)
+from .accessibility import AccessibilityProvider, ElementIndex
+from .zoom import (
+    OVERVIEW_SYSTEM_SUFFIX,
+    ZOOM_SYSTEM_SUFFIX,
+    ZOOM_TOOL,
+    TwoStageStats,
+    find_zoom_request,
+    zoom_box,
+)
+from .display import (
+    CoordinateMapping,
+    crop_screenshot,
+    downscale_screenshot,
+    get_image_size,
+    resolve_capture_region,
+    take_screenshot,
+)
+from .anthropic_client import (
+    build_computer_use_params,
+    count_request_tokens,
+    create_computer_use_request,
+    encode_image_to_base64,
+)
+from .daemon import DaemonUnavailable, ExecutorClient
+from .recorder import FlightRecorder
+from .memory import MemoryMonitor
+from .executor import (
+    ActionTiming,
+    count_valid_actions,
+    execute_tool_use_actions,
+    extract_computer_actions,
+)
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+# Kinds of pipeline step; see ``Step``
+STEP_STAGE = "stage"
+STEP_DISPLAY = "display"
+STEP_WORK = "work"
+STEP_CREATE = "create"
+STEP_COUNT = "count"
+
+
+@dataclass
+class Session:
+    """Long-lived state shared by all instructions of a run."""
+    client: Any
+    settings: Settings
+    display_size: Tuple[int, int]
+    router: ModelRouter
+    accountant: TokenAccountant = field(default_factory=TokenAccountant)
+    advisor: MaxTokensAdvisor = field(default_factory=MaxTokensAdvisor)
+    two_stage: TwoStageStats = field(default_factory=TwoStageStats)
+    accessibility: Optional[AccessibilityProvider] = None
+    executor: Optional[ExecutorClient] = None
+    recorder: Optional[FlightRecorder] = None
+    memory: Optional[MemoryMonitor] = None
+    # Screenshots are written to files starting with this prefix
+    file_prefix: str = "screenshot"
+
+
+@dataclass
+class Frame:
+    """A screenshot prepared for sending, with its coordinate space.
+
+    ``display_size`` is the coordinate space declared to Claude, ``image_size``
+    the pixel size of the image sent, and ``mapping`` converts coordinates to
+    the screen. The ``source_*`` and ``capture_*``
+    fields describe the full-resolution capture the image was derived from.
+    """
+    image_b64: str
+    display_size: Tuple[int, int]
+    mapping: Optional[CoordinateMapping] = None
+    image_tokens: int = 0
+    image_size: Tuple[int, int] = (0, 0)
+    context_text: str = ""
+    source_path: str = ""
+    source_size: Tuple[int, int] = (0, 0)
+    capture_size: Tuple[int, int] = (0, 0)
+    capture_origin: Tuple[int, int] = (0, 0)
+    media_type: str = "image/png"
+
+
+@dataclass
+class InstructionResult:
+    """Outcome of processing one instruction."""
+    instruction: str
+    model: str
+    actions_executed: int = 0
+    escalated: bool = False
+
+
+@dataclass
+class Step:
+    """One piece of work the instruction pipeline hands to its driver.
+
+    ``display`` steps call ``func`` where the screen and input devices are
+    used, ``work`` steps call it where CPU or disk work may block,
+    ``create`` and ``count`` steps send ``params`` to the API, and
+    ``stage`` steps only mark the start of the stage called ``name``.
+    The step's return value is sent back into the pipeline.
+    """
+    kind: str
+    name: str = ""
+    func: Optional[Callable[..., Any]] = None
+    args: Tuple[Any, ...] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+Steps = Generator[Step, Any, T]
+
+
+def perform_step(session: Session, step: Step) -> Any:
+    """Run one step on the calling thread with the session's client."""
+    if step.kind == STEP_STAGE:
+        return None
+    if step.kind == STEP_CREATE:
+        return create_computer_use_request(session.client, **step.params)
+    if step.kind == STEP_COUNT:
+        return count_request_tokens(session.client, step.params)
+    return step.func(*step.args)
+
+
+def run_steps(session: Session, steps: Steps[T]) -> T:
+    """Drive pipeline steps to completion on the calling thread and return their result.
+
+    A failing step's exception is raised inside the pipeline, so its
+    cleanup runs before the exception propagates.
+    """
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            value = perform_step(session, step)
+        except BaseException as e:
+            error = e
+
+
+def action_timing(settings: Settings) -> ActionTiming:
+    """Return the executor timing of the settings' performance profile."""
+    return ActionTiming(
+        click_delay=settings.click_delay,
+        settle_delay=settings.settle_delay,
+        move_duration=settings.move_duration,
+        drag_duration=settings.drag_duration,
+        retry_delay=settings.retry_delay,
+    )
+
+
+def apply_settings(session: Session, settings: Settings) -> None:
+    """Switch a session to new settings, e.g. after a profile reload."""
+    session.settings = settings
+    session.router.settings = settings
+
+
+def capture_screen(session: Session) -> Frame:
+    """Capture the configured screen region without encoding it.
+
+    The returned frame's mapping carries the region's origin, so actions
+    in screenshot coordinates land on the right screen pixels.
+    """
+    settings = session.settings
+
+    # Take screenshot of current screen
+    logger.info("Capturing current screen state")
+    region = resolve_capture_region(settings.capture_mode, settings.capture_monitor, settings.capture_rect)
+    screenshot_path = take_screenshot(region, f"{session.file_prefix}.png")
+    logger.info("Screenshot captured: %s", screenshot_path)
+
+    image_size = get_image_size(screenshot_path)
+    capture_size = region.size if region else session.display_size
+    capture_origin = region.origin if region else (0, 0)
+    return Frame(
+        image_b64="",
+        display_size=capture_size,
+        mapping=CoordinateMapping(origin_x=capture_origin[0], origin_y=capture_origin[1]) if region else None,
+        image_tokens=estimate_image_tokens(image_size),
+        image_size=image_size,
+        source_path=screenshot_path,
+        source_size=image_size,
+        capture_size=capture_size,
+        capture_origin=capture_origin,
+    )
+
+
+def scale_frame(frame: Frame, scale: float, output_name: str = "screenshot_scaled",
+                image_format: str = "png", quality: int = 85) -> Frame:
+    """Return a copy of ``frame`` whose image is the source scaled by ``scale``.
+
+    The image is encoded as ``image_format`` ("png" or "jpeg").
+    """
+    # Claude answers in the coordinates of the image it sees, so the reduced
+    # image becomes the declared display and the mapping restores screen space
+    scaled_size = (max(1, int(frame.source_size[0] * scale)), max(1, int(frame.source_size[1] * scale)))
+    extension = ".jpg" if image_format == "jpeg" else ".png"
+    scaled_path = downscale_screenshot(frame.source_path, scaled_size, output_name + extension, quality)
+    return replace(
+        frame,
+        image_b64=encode_image_to_base64(scaled_path),
+        media_type="image/jpeg" if image_format == "jpeg" else "image/png",
+        display_size=scaled_size,
+        mapping=CoordinateMapping(
+            scale_x=frame.capture_size[0] / scaled_size[0],
+            scale_y=frame.capture_size[1] / scaled_size[1],
+            origin_x=frame.capture_origin[0],
+            origin_y=frame.capture_origin[1],
+        ),
+        image_tokens=estimate_image_tokens(scaled_size),
+        image_size=scaled_size,
+        context_text="",
+    )
+
+
+def attach_accessibility(session: Session, frame: Frame, index: Optional[ElementIndex]) -> Frame:
+    """Add the element list in the frame's coordinates and enable click snapping."""
+    settings = session.settings
+    if index is None or not len(index):
+        return frame
+    mapping = frame.mapping or CoordinateMapping()
+    return replace(
+        frame,
+        context_text=index.to_text(frame.display_size, mapping, settings.accessibility_max_elements),
+        mapping=replace(mapping, snap=index.snap if settings.accessibility_snap else None),
+    )
+
+
+def get_accessibility_index(session: Session) -> Optional[ElementIndex]:
+    """Return the focused application's element index when accessibility context is on."""
+    if session.accessibility is None:
+        return None
+    return session.accessibility.get_index()
+
+
+def encode_frame(session: Session, frame: Frame) -> Tuple[Frame, Optional[ElementIndex]]:
+    """Encode a captured frame at the configured scale and format.
+
+    With accessibility context the element list is attached, and in
+    ``reduced`` mode it stands in for most of the screenshot's resolution.
+    Returns the frame and the element index used for it.
+    """
+    settings = session.settings
+    index = get_accessibility_index(session)
+
+    logger.info("Preparing request for Claude AI")
+    scale = settings.capture_scale
+    if index is not None and settings.accessibility_mode == "reduced":
+        scale *= settings.accessibility_screenshot_scale
+    if scale < 1.0 or settings.capture_format != "png":
+        frame = scale_frame(frame, scale, f"{session.file_prefix}_scaled",
+                            settings.capture_format, settings.jpeg_quality)
+    else:
+        frame.image_b64 = encode_image_to_base64(frame.source_path)
+    frame = attach_accessibility(session, frame, index)
+    logger.info("Image encoded for transmission")
+    return frame, index
+
+
+def budget_frame(session: Session, frame: Frame, index: Optional[ElementIndex], instruction_text: str,
+                 counted_tokens: Optional[int] = None) -> Frame:
+    """Shrink an encoded frame until the request fits the input token budget.
+
+    ``counted_tokens`` is a preflight count of the whole request; without it
+    the text is estimated locally. The screenshot is shrunk first and the
+    element list trimmed only if the smallest allowed screenshot still does
+    not fit.
+    """
+    settings = session.settings
+    if settings.max_input_tokens <= 0:
+        return frame
+
+    if counted_tokens is not None:
+        text_tokens = max(0, counted_tokens - frame.image_tokens)
+    else:
+        text_tokens = COMPUTER_USE_OVERHEAD_TOKENS + estimate_text_tokens(
+            settings.system_prompt, instruction_text, frame.context_text)
+
+    # Scales below are relative to the image already prepared
+    current_scale = frame.image_size[0] / frame.source_size[0]
+    min_scale = min(1.0, settings.min_image_scale / current_scale)
+    scale = fit_image_to_budget(text_tokens, frame.image_size, settings.max_input_tokens, min_scale)
+    if scale < 1.0:
+        scaled = scale_frame(frame, current_scale * scale, f"{session.file_prefix}_scaled",
+                             settings.capture_format, settings.jpeg_quality)
+        frame = attach_accessibility(session, scaled, index)
+
+    if frame.context_text:
+        other_tokens = text_tokens - estimate_text_tokens(frame.context_text)
+        available = settings.max_input_tokens - other_tokens - frame.image_tokens
+        frame.context_text = trim_context_to_budget(frame.context_text, max(0, available))
+    return frame
+
+
+def fit_steps(session: Session, frame: Frame, instruction_text: str, model: str) -> Steps[Frame]:
+    """Steps that encode a captured frame and fit the request to the token budget.
+
+    With preflight counting on, the API counts the request between encoding
+    and fitting.
+    """
+    settings = session.settings
+    frame, index = yield Step(STEP_WORK, func=encode_frame, args=(session, frame))
+    counted = None
+    if settings.max_input_tokens > 0 and settings.preflight_token_count:
+        counted = yield Step(STEP_COUNT, params=build_computer_use_params(
+            model=model,
+            instruction_text=instruction_text,
+            image_b64=frame.image_b64,
+            media_type=frame.media_type,
+            display_size=frame.display_size,
+            system_prompt=settings.system_prompt,
+            max_tokens=settings.max_tokens,
+            context_text=frame.context_text,
+        ))
+    return (yield Step(STEP_WORK, func=budget_frame, args=(session, frame, index, instruction_text, counted)))
+
+
+
+def overview_frame(session: Session, frame: Frame) -> Frame:
+    """Reduce a captured frame to the low-resolution overview of two-stage mode."""
+    settings = session.settings
+    logger.info("Preparing overview at scale %.2f", settings.overview_scale)
+    overview = scale_frame(frame, settings.overview_scale, f"{session.file_prefix}_overview",
+                           settings.capture_format, settings.jpeg_quality)
+    return attach_accessibility(session, overview, get_accessibility_index(session))
+
+
+def zoom_frame(session: Session, overview: Frame, region: Tuple[int, int, int, int]) -> Frame:
+    """Crop the full-resolution source of ``overview`` to a region Claude asked for."""
+    settings = session.settings
+    box = zoom_box(region, overview.display_size, overview.capture_size, settings.zoom_padding)
+
+    # The box is in capture units; the source image may be denser (e.g. HiDPI)
+    pixels_x = overview.source_size[0] / overview.capture_size[0]
+    pixels_y = overview.source_size[1] / overview.capture_size[1]
+    pixel_box = (int(box[0] * pixels_x), int(box[1] * pixels_y),
+                 int(box[2] * pixels_x), int(box[3] * pixels_y))
+    crop_path, crop_size = crop_screenshot(
+        overview.source_path, pixel_box, settings.zoom_max_edge,
+        f"{session.file_prefix}_crop" + (".jpg" if settings.capture_format == "jpeg" else ".png"),
+        settings.jpeg_quality,
+    )
+
+    crop = replace(
+        overview,
+        image_b64=encode_image_to_base64(crop_path),
+        display_size=crop_size,
+        mapping=CoordinateMapping(
+            scale_x=(box[2] - box[0]) / crop_size[0],
+            scale_y=(box[3] - box[1]) / crop_size[1],
+            origin_x=overview.capture_origin[0] + box[0],
+            origin_y=overview.capture_origin[1] + box[1],
+        ),
+        image_tokens=estimate_image_tokens(crop_size),
+        image_size=crop_size,
+        context_text="",
+    )
+    return attach_accessibility(session, crop, get_accessibility_index(session))
+
+
+def initial_max_tokens(session: Session, instruction_text: str) -> int:
+    """Return the max_tokens of the first request for an instruction."""
+    settings = session.settings
+    if settings.adaptive_max_tokens:
+        return session.advisor.suggest(instruction_text, settings.max_tokens)
+    return settings.max_tokens
+
+
+def record_request(session: Session, instruction_text: str, model: str, frame: Frame, max_tokens: int,
+                   extra_tools: Optional[List[Dict[str, Any]]] = None) -> None:
+    """Log a request about to be sent and add it to the flight recorder."""
+    logger.info("Sending request to Claude AI (model: %s, max_tokens: %s)", model, max_tokens)
+    if session.recorder is not None:
+        session.recorder.record_frame(frame.image_b64, frame.media_type)
+        session.recorder.record_request(
+            model=model, instruction=instruction_text, max_tokens=max_tokens,
+            display_size=frame.display_size, mapping=frame.mapping,
+            extra_tools=[tool["name"] for tool in extra_tools or []],
+            context_text=frame.context_text,
+        )
+
+
+def record_response(session: Session, instruction_text: str, model: str, frame: Frame,
+                    response: Any, max_tokens: int) -> Optional[int]:
+    """Account for a response and return a larger max_tokens if it should be retried.
+
+    A response cut short by adaptive max_tokens is retried once with the
+    configured ceiling.
+    """
+    if session.recorder is not None:
+        session.recorder.record_response(response)
+    usage = session.accountant.record(model, response, frame.image_tokens)
+
+    ceiling = session.settings.max_tokens
+    if getattr(response, "stop_reason", None) == "max_tokens" and max_tokens < ceiling:
+        logger.warning("Response hit adaptive max_tokens %s, retrying with %s", max_tokens, ceiling)
+        return ceiling
+
+    session.advisor.record(instruction_text, usage.output_tokens)
+    return None
+
+
+def request_steps(session: Session, instruction_text: str, model: str, frame: Frame,
+                  system_prompt: Optional[str] = None,
+                  extra_tools: Optional[List[Dict[str, Any]]] = None) -> Steps[Tuple[Any, float]]:
+    """Steps that send the instruction and frame to Claude; returns the response and its latency.
+
+    When adaptive max_tokens cut a response short, the request is repeated
+    once with the configured ceiling.
+    """
+    system_prompt = system_prompt or session.settings.system_prompt
+    max_tokens: Optional[int] = initial_max_tokens(session, instruction_text)
+    latency = 0.0
+
+    while max_tokens is not None:
+        # Recording decodes the frame, so it is not done where the request waits
+        yield Step(STEP_WORK, func=record_request,
+                   args=(session, instruction_text, model, frame, max_tokens, extra_tools))
+        started = time.perf_counter()
+        response = yield Step(STEP_CREATE, params=dict(
+            model=model,
+            instruction_text=instruction_text,
+            image_b64=frame.image_b64,
+            media_type=frame.media_type,
+            display_size=frame.display_size,
+            system_prompt=system_prompt,
+            max_tokens=max_tokens,
+            extra_tools=extra_tools,
+            context_text=frame.context_text,
+        ))
+        latency += time.perf_counter() - started
+        max_tokens = record_response(session, instruction_text, model, frame, response, max_tokens)
+
+    logger.info("Claude AI response received in %.2fs", latency)
+    return response, latency
+
+
+
+def two_stage_steps(session: Session, instruction_text: str, model: str,
+                    overview: Frame) -> Steps[Tuple[Any, float, Frame]]:
+    """Steps that send the overview and, if Claude asks for it, a zoomed crop.
+
+    Returns the response holding the actions, the combined latency and the
+    frame whose coordinate space those actions use.
+    """
+    settings = session.settings
+    response, latency = yield from request_steps(
+        session, instruction_text, model, overview,
+        system_prompt=settings.system_prompt + OVERVIEW_SYSTEM_SUFFIX,
+        extra_tools=[ZOOM_TOOL],
+    )
+    crop = None
+
+    region = find_zoom_request(response)
+    if region is not None:
+        crop = yield Step(STEP_WORK, func=zoom_frame, args=(session, overview, region))
+        response, zoom_latency = yield from request_steps(
+            session, instruction_text, model, crop,
+            system_prompt=settings.system_prompt + ZOOM_SYSTEM_SUFFIX,
+        )
+        latency += zoom_latency
+
+    return response, latency, crop or overview
+
+
+
+def record_two_stage(session: Session, overview: Frame, bytes_sent: int, image_tokens: int, zoomed: bool) -> None:
+    """Record what an instruction sent in two-stage mode against a single full-resolution request."""
+    # Baseline: the full-resolution source sent base64-encoded in one request
+    baseline_bytes = 4 * math.ceil(os.path.getsize(overview.source_path) / 3)
+    session.two_stage.record(bytes_sent, image_tokens, baseline_bytes,
+                             estimate_image_tokens(overview.source_size), zoomed)
+
+
+def execute_response(session: Session, response: Any, frame: Frame,
+                     on_result: Optional[Callable[[int, str, bool, float], None]] = None) -> int:
+    """Execute a response's actions on the executor daemon, or locally without one.
+
+    ``on_result`` is called after each action; an exception raised from it
+    stops the batch. If the daemon cannot be reached the session stops
+    using it and the batch runs locally. If it fails partway through a
+    batch a ``RuntimeError`` is raised, since that says nothing about the
+    model's actions.
+    """
+    successful = 0
+    max_retries = session.settings.max_retries
+    timing = action_timing(session.settings)
+    if session.executor is not None:
+        try:
+            successful = session.executor.execute(extract_computer_actions(response), frame.display_size,
+                                                  frame.mapping, max_retries, on_result, timing)
+        except DaemonUnavailable as e:
+            logger.warning("%s; executing actions in-process from now on", e)
+            session.executor = None
+        except (OSError, ConnectionError, RuntimeError) as e:
+            # Some actions may already have run, so do not replay the batch locally
+            logger.error("Executor daemon failed during batch: %s", e)
+            raise RuntimeError(f"Executor daemon failed during batch: {e}") from e
+    if session.executor is None:
+        successful = execute_tool_use_actions(response, frame.display_size, max_retries, frame.mapping, on_result,
+                                              timing)
+
+    if session.recorder is not None:
+        session.recorder.record_actions(extract_computer_actions(response), successful)
+    return successful
+
+
+def memory_stage(session: Session, name: str):
+    """Measure a pipeline stage when memory monitoring is on."""
+    return session.memory.stage(name) if session.memory is not None else nullcontext()
+
+
+def release_frame(frame: Frame) -> None:
+    """Drop a frame's encoded image once it has been sent."""
+    frame.image_b64 = ""
+
+
+def instruction_steps(session: Session, instruction_text: str, model: Optional[str] = None,
+                      on_result: Optional[Callable[[int, str, bool, float], None]] = None
+                      ) -> Steps[InstructionResult]:
+    """Steps that capture the screen, ask Claude for actions and execute them.
+
+    The first attempt goes to ``model``, or to the model picked by the
+    router when it is not given. If that model returns no valid actions,
+    or none of its actions succeed, the instruction is retried once on the
+    escalation model. ``on_result`` is passed on to ``execute_response``.
+    Each capture, request and execute stage begins with a ``stage`` step.
+    """
+    settings = session.settings
+    model = model or session.router.choose_model(instruction_text)
+    result = InstructionResult(instruction=instruction_text, model=model)
+    frame = None
+    # Images sent in two-stage mode over all attempts, recorded once per instruction
+    sent_bytes = sent_tokens = 0
+    zoomed = False
+
+    while model:
+        result.model = model
+
+        if frame is None:
+            with memory_stage(session, "capture"):
+                yield Step(STEP_STAGE, "capture")
+                frame = yield Step(STEP_DISPLAY, func=capture_screen, args=(session,))
+                if settings.two_stage:
+                    frame = yield Step(STEP_WORK, func=overview_frame, args=(session, frame))
+                else:
+                    frame = yield from fit_steps(session, frame, instruction_text, model)
+
+        with memory_stage(session, "request"):
+            yield Step(STEP_STAGE, "request")
+            if settings.two_stage:
+                response, latency, action_frame = yield from two_stage_steps(session, instruction_text, model, frame)
+                sent = [frame] if action_frame is frame else [frame, action_frame]
+                sent_bytes += sum(len(f.image_b64) for f in sent)
+                sent_tokens += sum(f.image_tokens for f in sent)
+                zoomed = zoomed or action_frame is not frame
+            else:
+                response, latency = yield from request_steps(session, instruction_text, model, frame)
+                action_frame = frame
+
+        next_model = session.router.escalation_model(model)
+        valid_actions = count_valid_actions(response, action_frame.display_size)
+        if valid_actions == 0 and next_model:
+            # Nothing was executed, so the same screenshot is still accurate
+            session.router.record(model, latency, success=False)
+            logger.warning("Model %s returned no valid actions, escalating to %s", model, next_model)
+            result.escalated = True
+            model = next_model
+            continue
+
+        # The encoded images are not needed once actions are chosen
+        release_frame(frame)
+        release_frame(action_frame)
+
+        # Execute actions
+        logger.info("Starting action execution phase")
+        with memory_stage(session, "execute"):
+            yield Step(STEP_STAGE, "execute")
+            try:
+                result.actions_executed = yield Step(STEP_DISPLAY, func=execute_response,
+                                                     args=(session, response, action_frame, on_result))
+            finally:
+                # Even a failed or cancelled batch may have changed the screen
+                if session.accessibility is not None:
+                    session.accessibility.invalidate()
+        success = valid_actions > 0 and result.actions_executed == valid_actions
+        session.router.record(model, latency, success)
+
+        if result.actions_executed == 0 and valid_actions > 0 and next_model:
+            # The screen may have changed during the failed attempt, so recapture
+            logger.warning("All actions from %s failed, escalating to %s", model, next_model)
+            result.escalated = True
+            frame = None
+            model = next_model
+            continue
+
+        break
+
+    if settings.two_stage:
+        record_two_stage(session, frame, sent_bytes, sent_tokens, zoomed)
+    return result
+
+
+def run_instruction(session: Session, instruction_text: str, model: Optional[str] = None) -> InstructionResult:
+    """Capture the screen, ask Claude for actions and execute them on the calling thread."""
+    return run_steps(session, instruction_steps(session, instruction_text, model))
@@ -0,0 +1,207 @@
+"""Token accounting, request budgets and adaptive max_tokens."""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Tuple
+import math
+import re
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Images are billed at roughly width * height / 750 tokens
+PIXELS_PER_IMAGE_TOKEN = 750
+# The API downsizes images beyond these limits before the model sees them
+MAX_IMAGE_EDGE = 1568
+MAX_IMAGE_PIXELS = 1_150_000
+# Rough token cost of the computer-use tool definition and its system prompt
+COMPUTER_USE_OVERHEAD_TOKENS = 1200
+CHARS_PER_TOKEN = 4
+
+# Adaptive max_tokens tuning
+MAX_TOKENS_HISTORY = 20
+MAX_TOKENS_MIN_SAMPLES = 3
+MAX_TOKENS_HEADROOM = 1.5
+MAX_TOKENS_FLOOR = 256
+
+# Per-request usage kept for inspection; session totals are unaffected
+MAX_REQUEST_HISTORY = 1000
+
+
+def estimate_image_tokens(image_size: Tuple[int, int]) -> int:
+    """Estimate the tokens an image costs after the API's own downsizing."""
+    width, height = image_size
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, MAX_IMAGE_EDGE / max(width, height), math.sqrt(MAX_IMAGE_PIXELS / (width * height)))
+    return math.ceil(width * scale * height * scale / PIXELS_PER_IMAGE_TOKEN)
+
+
+def estimate_text_tokens(*texts: str) -> int:
+    """Estimate the tokens of plain text prompts."""
+    return sum(math.ceil(len(text) / CHARS_PER_TOKEN) for text in texts if text)
+
+
+def fit_image_to_budget(text_tokens: int, image_size: Tuple[int, int], max_input_tokens: int,
+                        min_scale: float = 0.25) -> float:
+    """Return the scale factor that makes a request fit ``max_input_tokens``.
+
+    Returns 1.0 when the request already fits or no budget is configured.
+    The factor never drops below ``min_scale`` so the screenshot stays usable.
+    """
+    if max_input_tokens <= 0:
+        return 1.0
+
+    image_tokens = estimate_image_tokens(image_size)
+    total = text_tokens + image_tokens
+    if total <= max_input_tokens:
+        logger.debug("Request fits token budget: %s <= %s", total, max_input_tokens)
+        return 1.0
+
+    available = max_input_tokens - text_tokens
+    if available <= 0 or image_tokens == 0:
+        logger.warning("Text alone (%s tokens) exceeds token budget %s", text_tokens, max_input_tokens)
+        return min_scale
+
+    # Token cost scales with area, so the side length scales with the square root
+    # of the ratio. The image may already be shrunk by the API, so start from the
+    # effective size rather than the raw one.
+    width, height = image_size
+    effective = min(1.0, MAX_IMAGE_EDGE / max(width, height), math.sqrt(MAX_IMAGE_PIXELS / (width * height)))
+    scale = max(min_scale, effective * math.sqrt(available / image_tokens))
+    logger.info("Request estimated at %s tokens exceeds budget %s; scaling screenshot by %.2f",
+                total, max_input_tokens, scale)
+    return scale
+
+
+def trim_context_to_budget(context_text: str, max_tokens: int) -> str:
+    """Drop trailing lines of a context block until it fits ``max_tokens``.
+
+    The first line is treated as a header and kept only if at least one
+    entry fits under it.
+    """
+    if not context_text or estimate_text_tokens(context_text) <= max_tokens:
+        return context_text
+    lines = context_text.split("\n")
+    kept = lines[:1]
+    used = estimate_text_tokens(lines[0])
+    for line in lines[1:]:
+        cost = estimate_text_tokens(line + "\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if len(kept) == 1:
+        logger.info("Dropping context entirely to fit %s tokens", max_tokens)
+        return ""
+    logger.info("Trimmed context from %s to %s lines to fit %s tokens", len(lines) - 1, len(kept) - 1, max_tokens)
+    return "\n".join(kept)
+
+
+@dataclass
+class TokenUsage:
+    """Token counts for a single request or a running total."""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    image_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    requests: int = 0
+
+    def add(self, other: "TokenUsage") -> None:
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.image_tokens += other.image_tokens
+        self.cache_creation_input_tokens += other.cache_creation_input_tokens
+        self.cache_read_input_tokens += other.cache_read_input_tokens
+        self.requests += other.requests
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "image_tokens": self.image_tokens,
+            "cache_creation_input_tokens": self.cache_creation_input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+        }
+
+
+def usage_from_response(response: Any, image_tokens: int = 0) -> TokenUsage:
+    """Extract token usage from an API response."""
+    usage = getattr(response, "usage", None)
+    return TokenUsage(
+        input_tokens=getattr(usage, "input_tokens", 0) or 0,
+        output_tokens=getattr(usage, "output_tokens", 0) or 0,
+        image_tokens=image_tokens,
+        cache_creation_input_tokens=getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        cache_read_input_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0,
+        requests=1,
+    )
+
+
+class TokenAccountant:
+    """Per-request and per-session token accounting."""
+
+    def __init__(self):
+        self.session = TokenUsage()
+        self.by_model: Dict[str, TokenUsage] = {}
+        self.requests: Deque[Tuple[str, TokenUsage]] = deque(maxlen=MAX_REQUEST_HISTORY)
+
+    def record(self, model: str, response: Any, image_tokens: int = 0) -> TokenUsage:
+        """Record the usage of one response and return it."""
+        usage = usage_from_response(response, image_tokens)
+        self.requests.append((model, usage))
+        self.session.add(usage)
+        self.by_model.setdefault(model, TokenUsage()).add(usage)
+
+        logger.info("Request tokens: %s input (~%s image), %s output, cache %s written / %s read",
+                    usage.input_tokens, usage.image_tokens, usage.output_tokens,
+                    usage.cache_creation_input_tokens, usage.cache_read_input_tokens)
+        logger.info("Session tokens: %s input, %s output over %s request(s)",
+                    self.session.input_tokens, self.session.output_tokens, self.session.requests)
+        return usage
+
+    def summary(self) -> Dict[str, Any]:
+        """Return session totals and per-model breakdown."""
+        return {
+            "session": self.session.as_dict(),
+            "by_model": {model: usage.as_dict() for model, usage in self.by_model.items()},
+        }
+
+
+class MaxTokensAdvisor:
+    """Suggest max_tokens from the output lengths of similar past instructions.
+
+    Instructions are grouped by their leading verb and a word-count bucket.
+    Once a group has enough samples, the suggestion is the largest recent
+    output times a headroom factor, capped by the configured ceiling.
+    """
+
+    def __init__(self, floor: int = MAX_TOKENS_FLOOR):
+        self.floor = floor
+        self.history: Dict[Tuple[str, int], Deque[int]] = {}
+
+    @staticmethod
+    def instruction_key(instruction_text: str) -> Tuple[str, int]:
+        words = re.findall(r"[\w']+", instruction_text.lower())
+        verb = words[0] if words else ""
+        bucket = min(len(words) // 4, 4)
+        return verb, bucket
+
+    def suggest(self, instruction_text: str, ceiling: int) -> int:
+        """Return the max_tokens to use for ``instruction_text``."""
+        samples = self.history.get(self.instruction_key(instruction_text))
+        if not samples or len(samples) < MAX_TOKENS_MIN_SAMPLES:
+            return ceiling
+        suggested = int(max(samples) * MAX_TOKENS_HEADROOM)
+        suggested = max(self.floor, min(ceiling, suggested))
+        logger.debug("Adaptive max_tokens for '%s': %s (ceiling %s)", instruction_text, suggested, ceiling)
+        return suggested
+
+    def record(self, instruction_text: str, output_tokens: int) -> None:
+        """Record the observed output length for an instruction."""
+        key = self.instruction_key(instruction_text)
+        if key not in self.history:
+            self.history[key] = deque(maxlen=MAX_TOKENS_HISTORY)
+        self.history[key].append(output_tokens)
@@ -1,4 +1,5 @@
 """User interface for Self Flow."""
+from typing import Optional
 from .logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -13,7 +14,7 @@ def get_user_instruction() -> str:
     print("="*50)
     print("Enter an instruction for what you want to do:")
     print("Examples: 'click on chrome', 'type hello', 'press enter'")
-    print("Type 'quit' to exit the program")
+    print("Type 'quit' to exit the program, 'dump' to save recent history")
     print("="*50)
     
     instruction = input("\nInstruction: ").strip()
@@ -33,6 +34,27 @@ def should_quit(instruction: str) -> bool:
     return instruction.lower() in ['quit', 'exit', 'q']
 
 
+def is_dump_command(instruction: str) -> bool:
+    """Check if the user asked to dump the flight recorder."""
+    return instruction.lower() == 'dump'
+
+
+def is_status_command(instruction: str) -> bool:
+    """Check if the user asked for the instruction queue status."""
+    return instruction.lower() == 'status'
+
+
+def parse_cancel_command(instruction: str) -> Optional[int]:
+    """Return the id in a 'cancel <id>' command, or None for other input."""
+    parts = instruction.split()
+    if len(parts) == 2 and parts[0].lower() == 'cancel':
+        try:
+            return int(parts[1].lstrip('#'))
+        except ValueError:
+            return None
+    return None
+
+
 def display_loop_header() -> None:
     """Display the loop header for continuous operation."""
     print("\n" + "="*50)
@@ -40,3 +62,13 @@ def display_loop_header() -> None:
     print("="*50)
     print("Enter instructions one by one. Type 'quit' to exit.")
     print("="*50)
+
+
+def display_queue_header() -> None:
+    """Display the header for queued operation."""
+    print("\n" + "="*50)
+    print("SELF FLOW - Desktop Automation (Queue Mode)")
+    print("="*50)
+    print("Type instructions at any time; they run in order.")
+    print("Commands: 'status', 'cancel <id>', 'dump', 'quit'")
+    print("="*50)
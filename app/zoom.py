@@ -0,0 +1,119 @@
+"""Coarse-to-fine capture: a low-resolution overview plus on-demand zoom crops."""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import math
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Client-side tool Claude calls to ask for a full-resolution crop of the overview
+ZOOM_TOOL = {
+    "name": "zoom",
+    "description": (
+        "Request a full-resolution view of part of the overview screenshot. "
+        "Use it when the overview is too coarse to place an action precisely. "
+        "Give the region as [x1, y1, x2, y2] in overview screenshot coordinates."
+    ),
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "region": {
+                "type": "array",
+                "items": {"type": "integer"},
+                "minItems": 4,
+                "maxItems": 4,
+                "description": "Region to zoom into as [x1, y1, x2, y2]",
+            },
+        },
+        "required": ["region"],
+    },
+}
+
+OVERVIEW_SYSTEM_SUFFIX = """
+
+The screenshot is a reduced-resolution overview of the screen. If you can place the
+action precisely on it, act directly. Otherwise call the zoom tool with the region
+that contains your target and you will receive a full-resolution view of it."""
+
+ZOOM_SYSTEM_SUFFIX = """
+
+The screenshot is a full-resolution view of only part of the screen, zoomed in on the
+region you asked for. Give coordinates relative to this view."""
+
+
+def find_zoom_request(message: Any) -> Optional[Tuple[int, int, int, int]]:
+    """Return the region of the first zoom tool call in a response, if any."""
+    for block in getattr(message, "content", []) or []:
+        if getattr(block, "type", None) == "tool_use" and getattr(block, "name", None) == "zoom":
+            region = (getattr(block, "input", {}) or {}).get("region")
+            try:
+                x1, y1, x2, y2 = (int(v) for v in region)
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed zoom region: %s", region)
+                return None
+            logger.info("Claude requested zoom into overview region %s", [x1, y1, x2, y2])
+            return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+    return None
+
+
+def zoom_box(region: Tuple[int, int, int, int], overview_size: Tuple[int, int],
+             capture_size: Tuple[int, int], padding: float = 0.1,
+             min_size: int = 64) -> Tuple[int, int, int, int]:
+    """Convert an overview region to a padded box in capture coordinates.
+
+    The box is grown by ``padding`` of its size on each side, kept at least
+    ``min_size`` wide and tall, and clamped to the captured area.
+    """
+    scale_x = capture_size[0] / overview_size[0]
+    scale_y = capture_size[1] / overview_size[1]
+    x1, y1, x2, y2 = region[0] * scale_x, region[1] * scale_y, region[2] * scale_x, region[3] * scale_y
+
+    pad_x = max((x2 - x1) * padding, (min_size - (x2 - x1)) / 2, 0)
+    pad_y = max((y2 - y1) * padding, (min_size - (y2 - y1)) / 2, 0)
+    left = max(0, int(x1 - pad_x))
+    top = max(0, int(y1 - pad_y))
+    right = min(capture_size[0], int(math.ceil(x2 + pad_x)))
+    bottom = min(capture_size[1], int(math.ceil(y2 + pad_y)))
+    if right <= left or bottom <= top:
+        return 0, 0, capture_size[0], capture_size[1]
+    return left, top, right, bottom
+
+
+@dataclass
+class TwoStageStats:
+    """Bytes and image tokens sent in two-stage mode against a full-frame baseline."""
+    instructions: int = 0
+    zooms: int = 0
+    bytes_sent: int = 0
+    image_tokens_sent: int = 0
+    baseline_bytes: int = 0
+    baseline_image_tokens: int = 0
+
+    def record(self, bytes_sent: int, image_tokens: int, baseline_bytes: int,
+               baseline_image_tokens: int, zoomed: bool) -> None:
+        """Record one instruction and log its savings."""
+        self.instructions += 1
+        self.zooms += int(zoomed)
+        self.bytes_sent += bytes_sent
+        self.image_tokens_sent += image_tokens
+        self.baseline_bytes += baseline_bytes
+        self.baseline_image_tokens += baseline_image_tokens
+        logger.info("Two-stage capture: %s bytes / ~%s image tokens sent vs full frame %s bytes / ~%s tokens (%s)",
+                    bytes_sent, image_tokens, baseline_bytes, baseline_image_tokens,
+                    "overview + zoom" if zoomed else "overview only")
+
+    def summary(self) -> Dict[str, Any]:
+        def saved(sent: int, baseline: int) -> float:
+            return 1 - sent / baseline if baseline else 0.0
+
+        return {
+            "instructions": self.instructions,
+            "zooms": self.zooms,
+            "bytes_sent": self.bytes_sent,
+            "baseline_bytes": self.baseline_bytes,
+            "bytes_saved": saved(self.bytes_sent, self.baseline_bytes),
+            "image_tokens_sent": self.image_tokens_sent,
+            "baseline_image_tokens": self.baseline_image_tokens,
+            "image_tokens_saved": saved(self.image_tokens_sent, self.baseline_image_tokens),
+        }
@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 """Self Flow - Desktop automation using Claude AI."""
 
-from app.config import load_settings
+import asyncio
+from app.config import ProfileWatcher, load_settings
 from app.logger import setup_logger
-from app.display import get_primary_display_size, take_screenshot
-from app.anthropic_client import build_client, create_computer_use_request, encode_image_to_base64
-from app.executor import execute_tool_use_actions
-from app.ui import get_user_instruction, should_quit, display_loop_header
+from app.display import get_primary_display_size
+from app.anthropic_client import build_client
+from app.router import ModelRouter
+from app.accessibility import AccessibilityProvider
+from app.daemon import ExecutorClient
+from app.session import Session, apply_settings, run_instruction
+from app.recorder import FlightRecorder
+from app.memory import MemoryMonitor
+from app.instruction_queue import InstructionQueue
+from app.ui import get_user_instruction, should_quit, is_dump_command, display_loop_header, display_queue_header
 
 
-def process_single_instruction(client, settings, display_size, logger) -> bool:
+def process_single_instruction(session, logger, profile_watcher=None) -> bool:
     """Process a single user instruction and return success status."""
     try:
         # Get instruction from user
@@ -23,36 +30,26 @@ def process_single_instruction(client, settings, display_size, logger) -> bool:
             logger.info("User requested to quit")
             return False  # Exit loop
         
-        logger.info("User instruction received: '%s'", instruction_text)
-        
-        # Take screenshot of current screen
-        logger.info("Capturing current screen state")
-        screenshot_path = take_screenshot()
-        logger.info("Screenshot captured: %s", screenshot_path)
+        if is_dump_command(instruction_text):
+            if session.recorder is not None:
+                path = session.recorder.dump(session.settings.recorder_dir, reason="requested by user")
+                print(f"Flight recorder saved to {path}")
+            else:
+                print("Flight recorder is disabled.")
+            return True
         
-        # Encode screenshot and send to Claude
-        logger.info("Preparing request for Claude AI")
-        img_b64 = encode_image_to_base64(screenshot_path)
-        logger.info("Image encoded for transmission")
-        
-        # Send request to Claude
-        logger.info("Sending request to Claude AI")
-        response = create_computer_use_request(
-            client=client,
-            model="claude-sonnet-4-20250514",
-            instruction_text=instruction_text,
-            image_b64=img_b64,
-            media_type="image/png",
-            display_size=display_size,
-            system_prompt=settings.system_prompt,
-            max_tokens=settings.max_tokens,
-        )
+        logger.info("User instruction received: '%s'", instruction_text)
         
-        logger.info("Claude AI response received successfully")
+        # Pick up profile edits made since the last instruction
+        if profile_watcher is not None:
+            updated = profile_watcher.reload(session.settings)
+            if updated is not None:
+                apply_settings(session, updated)
         
-        # Execute actions
-        logger.info("Starting action execution phase")
-        actions_executed = execute_tool_use_actions(response, display_size)
+        result = run_instruction(session, instruction_text)
+        actions_executed = result.actions_executed
+        if result.escalated:
+            logger.info("Instruction was escalated to %s", result.model)
         
         if actions_executed > 0:
             logger.info("Automation completed successfully. Executed %s action(s).", actions_executed)
@@ -64,6 +61,12 @@ def process_single_instruction(client, settings, display_size, logger) -> bool:
     except Exception as e:
         logger.exception("Error processing instruction: %s", e)
         print(f"Error: {e}")
+        if session.recorder is not None:
+            try:
+                path = session.recorder.dump(session.settings.recorder_dir, reason=repr(e))
+                print(f"Recent history saved to {path}")
+            except Exception as dump_error:
+                logger.error("Failed to dump flight recorder: %s", dump_error)
         print("Continuing with next instruction...")
         return True  # Continue loop despite error
 
@@ -88,24 +91,71 @@ def main() -> None:
         display_size = get_primary_display_size()
         logger.info("Display configuration: %sx%s", *display_size)
         
-        # Display loop header
-        display_loop_header()
-        
-        # Main loop for processing instructions
-        instruction_count = 0
-        while True:
-            instruction_count += 1
-            logger.info("Processing instruction #%s", instruction_count)
-            
-            # Process the instruction
-            should_continue = process_single_instruction(client, settings, display_size, logger)
-            
-            if not should_continue:
-                break
+        session = Session(
+            client=client,
+            settings=settings,
+            display_size=display_size,
+            router=ModelRouter(settings),
+        )
+        profile_watcher = ProfileWatcher(settings.profile_file) if settings.profile_file else None
+        if settings.accessibility_mode != "off":
+            session.accessibility = AccessibilityProvider(
+                time_budget=settings.accessibility_time_budget,
+                cache_ttl=settings.accessibility_cache_ttl,
+            )
+        if settings.recorder_capacity_mb > 0:
+            session.recorder = FlightRecorder(settings.recorder_capacity_mb * 1024 * 1024)
+        if settings.memory_tracing or settings.memory_rss_warn_mb or settings.memory_rss_limit_mb:
+            session.memory = MemoryMonitor(
+                tracing=settings.memory_tracing,
+                snapshot_interval=settings.memory_snapshot_interval,
+                rss_warn_mb=settings.memory_rss_warn_mb,
+                rss_limit_mb=settings.memory_rss_limit_mb,
+            )
+            session.memory.register_eviction("max_tokens history", session.advisor.history.clear)
+            session.memory.register_eviction("token request history", session.accountant.requests.clear)
+            if session.accessibility is not None:
+                session.memory.register_eviction("accessibility index", session.accessibility.invalidate)
+        if settings.executor_socket:
+            # A batch may legitimately run as long as the execute stage is allowed to
+            executor = ExecutorClient(settings.executor_socket, timeout=settings.execute_timeout or None)
+            if executor.ping():
+                session.executor = executor
+            else:
+                logger.warning("Executor daemon unavailable, executing actions in-process")
+        
+        if settings.instruction_queue:
+            # Instructions are typed ahead while earlier ones run
+            display_queue_header()
+            instruction_count = asyncio.run(InstructionQueue(session, profile_watcher).run())
+        else:
+            # Display loop header
+            display_loop_header()
             
-            print(f"\nInstruction #{instruction_count} completed. Ready for next instruction...")
+            # Main loop for processing instructions
+            instruction_count = 0
+            while True:
+                instruction_count += 1
+                logger.info("Processing instruction #%s", instruction_count)
+                
+                # Process the instruction
+                should_continue = process_single_instruction(session, logger, profile_watcher)
+                
+                if not should_continue:
+                    break
+                
+                if session.memory is not None:
+                    session.memory.after_instruction()
+                
+                print(f"\nInstruction #{instruction_count} completed. Ready for next instruction...")
         
         logger.info("Self Flow automation session completed. Processed %s instructions.", instruction_count)
+        logger.info("Model statistics: %s", session.router.summary())
+        logger.info("Token usage: %s", session.accountant.summary())
+        if settings.two_stage:
+            logger.info("Two-stage capture: %s", session.two_stage.summary())
+        if session.memory is not None:
+            logger.info("Memory: %s", session.memory.summary())
         print(f"\nSession completed! Processed {instruction_count} instructions.")
         
     except Exception as e:
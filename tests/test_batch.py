@@ -0,0 +1,167 @@
+"""Round trip of bulk planning against an in-process fake of the Batches API."""
+
+from types import SimpleNamespace
+import json
+
+import pytest
+from PIL import Image
+
+from app import batch
+from app.batch import (
+    AnthropicBatchTransport,
+    BatchTransport,
+    LocalBatchTransport,
+    load_manifest,
+    load_plans,
+    plan_batch,
+    save_plans,
+)
+from app.config import Settings
+
+
+def tool_use(action, **params):
+    return SimpleNamespace(type="tool_use", name="computer", input={"action": action, **params})
+
+
+class FakeBatches:
+    """Stands in for ``client.beta.messages.batches``.
+
+    Each batch reports ``in_progress`` for ``polls_until_done`` retrievals
+    before it ends. Requests whose instruction contains "fail" error out.
+    """
+
+    def __init__(self, polls_until_done=1):
+        self.polls_until_done = polls_until_done
+        self.submitted = []
+        self.retrievals = {}
+
+    def create(self, requests, betas):
+        batch_id = f"msgbatch_{len(self.submitted) + 1}"
+        self.submitted.append((batch_id, list(requests), betas))
+        self.retrievals[batch_id] = 0
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id, betas):
+        self.retrievals[batch_id] += 1
+        done = self.retrievals[batch_id] > self.polls_until_done
+        return SimpleNamespace(processing_status="ended" if done else "in_progress", request_counts=None)
+
+    def results(self, batch_id, betas):
+        requests = next(requests for submitted_id, requests, _ in self.submitted if submitted_id == batch_id)
+        for request in requests:
+            instruction = request["params"]["messages"][0]["content"][0]["text"]
+            if "fail" in instruction:
+                result = SimpleNamespace(type="errored", error="invalid_request_error")
+            else:
+                message = SimpleNamespace(content=[tool_use("left_click", coordinate=[10, 20])])
+                result = SimpleNamespace(type="succeeded", message=message)
+            yield SimpleNamespace(custom_id=request["custom_id"], result=result)
+
+
+class FakeMessages:
+    """Stands in for ``client.beta.messages``."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.created = []
+
+    def create(self, betas, **params):
+        self.created.append(params)
+        return SimpleNamespace(content=[tool_use("type", text="hello")])
+
+
+def fake_client(polls_until_done=1):
+    messages = FakeMessages(FakeBatches(polls_until_done))
+    return SimpleNamespace(beta=SimpleNamespace(messages=messages))
+
+
+def write_manifest(tmp_path, entries):
+    Image.new("RGB", (64, 48), (255, 255, 255)).save(tmp_path / "shot.png")
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("\n".join(json.dumps({"screenshot": "shot.png", **entry}) for entry in entries) + "\n")
+    return str(manifest)
+
+
+def test_plan_poll_and_save_round_trip(tmp_path):
+    manifest = write_manifest(tmp_path, [
+        {"id": "login-1", "instruction": "click login"},
+        {"id": "broken", "instruction": "fail please"},
+        {"id": "missing", "instruction": "click", "screenshot": "missing.png"},
+    ])
+    client = fake_client(polls_until_done=2)
+    settings = Settings(anthropic_api_key="test")
+
+    records = plan_batch(AnthropicBatchTransport(client), load_manifest(manifest), settings,
+                         model="test-model", poll_interval=0)
+
+    batches = client.beta.messages.batches
+    assert len(batches.submitted) == 1
+    _, requests, betas = batches.submitted[0]
+    assert [r["custom_id"] for r in requests] == ["login-1", "broken"]
+    assert betas == ["computer-use-2025-01-24"]
+    assert "betas" not in requests[0]["params"]
+    assert batches.retrievals["msgbatch_1"] == 3
+
+    output = tmp_path / "plans.jsonl"
+    save_plans(records, str(output))
+    plans = load_plans(str(output))
+    assert plans["login-1"].actions == [{"action": "left_click", "coordinate": [10, 20]}]
+    assert plans["login-1"].display_size == (64, 48)
+    assert plans["login-1"].model == "test-model"
+    assert plans["broken"].error == "errored: invalid_request_error"
+    assert plans["missing"].error and not plans["missing"].actions
+
+
+def test_plan_splits_batches_by_size(tmp_path, monkeypatch):
+    manifest = write_manifest(tmp_path, [{"id": f"item-{i}", "instruction": "click"} for i in range(3)])
+    items = load_manifest(manifest)
+    request, _ = batch.build_batch_request(items[0], "test-model", Settings(anthropic_api_key="test"))
+    # Room for two requests per batch
+    monkeypatch.setattr(batch, "MAX_BATCH_BYTES", 2 * batch.estimate_request_bytes(request))
+    client = fake_client(polls_until_done=0)
+
+    records = plan_batch(AnthropicBatchTransport(client), items, Settings(anthropic_api_key="test"),
+                         model="test-model", poll_interval=0)
+
+    sizes = [len(requests) for _, requests, _ in client.beta.messages.batches.submitted]
+    assert sizes == [2, 1]
+    assert all(record.actions for record in records)
+
+
+def test_local_transport_sends_requests_directly(tmp_path):
+    manifest = write_manifest(tmp_path, [{"id": "a", "instruction": "say hello"}])
+    client = fake_client()
+
+    records = plan_batch(LocalBatchTransport(client), load_manifest(manifest), Settings(anthropic_api_key="test"),
+                         model="test-model", poll_interval=0)
+
+    assert len(client.beta.messages.created) == 1
+    assert records[0].actions == [{"action": "type", "text": "hello"}]
+
+
+@pytest.mark.parametrize("item_id", ["has space", "x" * 65, "dot.ted", ""])
+def test_load_manifest_rejects_invalid_ids(tmp_path, item_id):
+    manifest = write_manifest(tmp_path, [{"id": item_id, "instruction": "click"}])
+    with pytest.raises(ValueError, match="id"):
+        load_manifest(manifest)
+
+
+def test_load_manifest_defaults_id_to_line_number(tmp_path):
+    manifest = write_manifest(tmp_path, [{"instruction": "click"}, {"instruction": "type"}])
+    assert [item.id for item in load_manifest(manifest)] == ["1", "2"]
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    manifest = write_manifest(tmp_path, [{"id": "same", "instruction": "a"}, {"id": "same", "instruction": "b"}])
+    with pytest.raises(ValueError, match="Duplicate"):
+        plan_batch(AnthropicBatchTransport(fake_client()), load_manifest(manifest),
+                   Settings(anthropic_api_key="test"), model="test-model", poll_interval=0)
+
+
+def test_transport_must_implement_all_methods():
+    class Incomplete(BatchTransport):
+        def submit(self, requests, betas):
+            return "batch"
+
+    with pytest.raises(TypeError):
+        Incomplete()